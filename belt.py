@@ -0,0 +1,78 @@
+'''Arrival times of blocks on a conveyor belt, from two reflection sensors upstream of the pickup zone.
+
+A block reflects more than the bare belt. The time a block's center
+passes a sensor is the middle of the time it was in front of it, so the
+block's length does not matter. The time between the two sensors gives
+the belt speed, and the speed gives when the block reaches the pickup.
+The far sensor gives a first estimate with the speed measured so far,
+the near one corrects it once the block has passed it too.
+'''
+
+THRESHOLD = 10              # Reflection above the bare belt that counts as a block
+BELT_WEIGHT = 0.05          # Weight of a new bare belt reading in its average
+MIN_TIME = 20               # ms a block is at least in front of a sensor, shorter is noise
+SPEED_WEIGHT = 0.5          # Weight of the newest measurement in the belt speed
+
+
+class BeltTracker:
+
+    def __init__(self, sensors, distances, clock):
+        self.sensors = sensors          # Far and near sensor
+        self.distances = distances      # mm from each sensor to the pickup zone
+        self.clock = clock              # Returns the time in ms
+        self.belt = [None, None]        # Reflection of the bare belt at each sensor
+        self.entered = [None, None]     # Time the block in front of each sensor appeared
+        self.speed = None               # mm/ms
+        self.blocks = []                # [time it passed the far sensor, predicted arrival, seen by the near sensor]
+
+    def task(self):
+        '''Scheduler task sampling both sensors on every tick.'''
+        while True:
+            self.sample()
+            yield
+
+    def sample(self):
+        now = self.clock()
+        for index, sensor in enumerate(self.sensors):
+            value = sensor.reflection()
+            if self.belt[index] is None:
+                self.belt[index] = value
+            if value >= self.belt[index] + THRESHOLD:
+                if self.entered[index] is None:
+                    self.entered[index] = now
+                continue
+            self.belt[index] += BELT_WEIGHT * (value - self.belt[index])
+            if self.entered[index] is not None:
+                if now - self.entered[index] >= MIN_TIME:
+                    self.centerPassed(index, (self.entered[index] + now) / 2)
+                self.entered[index] = None
+
+    def centerPassed(self, index, time):
+        if index == 0:
+            arrival = None if self.speed is None else time + self.distances[0] / self.speed
+            self.blocks.append([time, arrival, False])
+            return
+        block = None
+        for candidate in self.blocks:
+            if not candidate[2]:
+                block = candidate
+                break
+        if block is None or time <= block[0]:      # Was already past the far sensor at start up
+            return
+        speed = (self.distances[0] - self.distances[1]) / (time - block[0])
+        self.speed = speed if self.speed is None else self.speed + SPEED_WEIGHT * (speed - self.speed)
+        block[1] = time + self.distances[1] / speed
+        block[2] = True
+
+    def next(self, earliest):
+        '''First block predicted to arrive at earliest or later, None if there is none.
+
+        The block is a list whose item 1 is the predicted arrival, kept up to
+        date until it arrives. Blocks arriving before earliest are dropped.
+        '''
+        while self.blocks and self.blocks[0][1] is not None and self.blocks[0][1] < earliest:
+            self.blocks.pop(0)
+        for block in self.blocks:
+            if block[1] is not None and block[1] >= earliest:
+                return block
+        return None
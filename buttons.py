@@ -0,0 +1,80 @@
+'''Button events from a background task that samples the EV3 buttons every tick.
+
+A button only changes state once the new state has held for DEBOUNCE ms.
+Every change is queued as a PRESS or RELEASE event, and a button held for
+LONG_PRESS_TIME ms also queues one LONG_PRESS. Events are (kind, button,
+time) tuples, read with get().
+'''
+
+PRESS = "press"
+RELEASE = "release"
+LONG_PRESS = "long press"
+
+DEBOUNCE = 30               # ms a new button state has to hold before it counts
+LONG_PRESS_TIME = 2000      # ms a button is held before LONG_PRESS
+QUEUE_SIZE = 16             # Oldest events are dropped beyond this
+
+
+class ButtonEvents:
+
+    def __init__(self, buttons, clock):
+        self.buttons = buttons
+        self.clock = clock          # Returns the time in ms
+        self.held = {}              # button -> time it was pressed
+        self.changing = {}          # button -> time its raw state started to differ from held
+        self.long = []              # Held buttons that already sent LONG_PRESS
+        self.queue = []
+
+    def task(self):
+        '''Scheduler task sampling the buttons on every tick.'''
+        while True:
+            self.sample()
+            yield
+
+    def sample(self):
+        now = self.clock()
+        raw = self.buttons.pressed()
+        for button in set(raw) | set(self.held) | set(self.changing):
+            down = button in raw
+            if down == (button in self.held):
+                self.changing.pop(button, None)
+            elif button not in self.changing:
+                self.changing[button] = now
+            elif now - self.changing[button] >= DEBOUNCE:
+                del self.changing[button]
+                if down:
+                    self.held[button] = now
+                    self.push(PRESS, button, now)
+                else:
+                    del self.held[button]
+                    if button in self.long:
+                        self.long.remove(button)
+                    self.push(RELEASE, button, now)
+
+        for button, since in self.held.items():
+            if button not in self.long and now - since >= LONG_PRESS_TIME:
+                self.long.append(button)
+                self.push(LONG_PRESS, button, now)
+
+    def push(self, kind, button, time):
+        if len(self.queue) >= QUEUE_SIZE:
+            self.queue.pop(0)
+        self.queue.append((kind, button, time))
+
+    def get(self):
+        '''Oldest event, None if there is none.'''
+        return self.queue.pop(0) if self.queue else None
+
+    def pressed(self):
+        '''Button of the oldest PRESS event, None if there is none. Drops other events.'''
+        while self.queue:
+            kind, button, time = self.queue.pop(0)
+            if kind == PRESS:
+                return button
+        return None
+
+    def clear(self):
+        self.queue = []
+
+    def isHeld(self, button):
+        return button in self.held
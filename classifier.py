@@ -0,0 +1,165 @@
+'''Color/size classifier trained from calibration samples.
+
+Each calibrated label (color name, size) is modelled by the mean and
+spread of its (r, g, b, reflection) readings. compile() turns the model
+into a quantized lookup table, so classify() is one index into a bytearray.
+'''
+
+STEP = 8                    # Sensor values per table bin
+BINS = 100 // STEP + 1      # Bins per channel, readings go from 0 to 100
+CHANNELS = 4                # r, g, b, reflection
+MIN_SIGMA = 3.0             # Floor for a label's spread so exact repeats still leave a margin
+MAX_SIGMAS = 4.0            # Readings further than this from a label are unknown
+UNKNOWN = 255
+
+
+def quantize(value):
+    return min(max(int(value), 0), 100) // STEP
+
+
+class ColorClassifier:
+
+    def __init__(self):
+        self.labels = []        # [(color name, size), ...]
+        self.means = []
+        self.sigmas = []
+        self.samples = {}       # label -> [count, sums, sums of squares], stored so a new calibration adds to them
+        self.table = None
+
+    def trained(self):
+        return self.table is not None
+
+    def reset(self):
+        self.__init__()
+
+    def addSamples(self, label, channel, values):
+        '''Adds readings of one channel (0-3) for label.'''
+        label = tuple(label)
+        if label not in self.samples:
+            self.samples[label] = [[0] * CHANNELS, [0.0] * CHANNELS, [0.0] * CHANNELS]
+        count, sums, squares = self.samples[label]
+        for value in values:
+            count[channel] += 1
+            sums[channel] += value
+            squares[channel] += value * value
+
+    def train(self):
+        '''Recomputes the model of every label with samples and compiles it.
+
+        Labels without samples, loaded from a config saved before the samples
+        were stored, keep the model they were loaded with.
+        '''
+        labels, means, sigmas = [], [], []
+        for index, label in enumerate(self.labels):
+            if label not in self.samples:
+                labels.append(label)
+                means.append(self.means[index])
+                sigmas.append(self.sigmas[index])
+        for label, (count, sums, squares) in self.samples.items():
+            if min(count) == 0:
+                continue
+            mean = [sums[c] / count[c] for c in range(CHANNELS)]
+            sigma = [max((max(squares[c] / count[c] - mean[c] * mean[c], 0)) ** 0.5, MIN_SIGMA)
+                     for c in range(CHANNELS)]
+            labels.append(label)
+            means.append(mean)
+            sigmas.append(sigma)
+        self.labels, self.means, self.sigmas = labels, means, sigmas
+        self.compile()
+
+    def compile(self):
+        '''Fills the lookup table, each bin gets the closest label within MAX_SIGMAS.'''
+        if not self.labels:
+            self.table = None
+            return
+        # Repeating bytes, not the bytearray: the EV3's MicroPython can not multiply a bytearray
+        table = bytearray(bytes([UNKNOWN]) * (BINS ** CHANNELS))
+        best = bytearray(b"\xff" * (BINS ** CHANNELS))     # Distance of the label stored in each bin, x10
+
+        for index in range(len(self.labels)):
+            mean, sigma = self.means[index], self.sigmas[index]
+            ranges = [range(quantize(mean[c] - MAX_SIGMAS * sigma[c]), quantize(mean[c] + MAX_SIGMAS * sigma[c]) + 1)
+                      for c in range(CHANNELS)]
+            for r in ranges[0]:
+                dr = self._distance(r, mean[0], sigma[0])
+                for g in ranges[1]:
+                    dg = max(dr, self._distance(g, mean[1], sigma[1]))
+                    for b in ranges[2]:
+                        db = max(dg, self._distance(b, mean[2], sigma[2]))
+                        cell = ((r * BINS + g) * BINS + b) * BINS
+                        for l in ranges[3]:
+                            distance = max(db, self._distance(l, mean[3], sigma[3]))
+                            if distance > MAX_SIGMAS:
+                                continue
+                            distance = int(distance * 10)
+                            if distance < best[cell + l]:
+                                best[cell + l] = distance
+                                table[cell + l] = index
+        self.table = table
+
+    def _distance(self, bin, mean, sigma):
+        '''Distance in sigmas from mean to the closest value inside bin.'''
+        low = bin * STEP
+        high = low + STEP - 1
+        if mean < low:
+            return (low - mean) / sigma
+        if mean > high:
+            return (mean - high) / sigma
+        return 0
+
+    def classify(self, reading):
+        '''(r, g, b, reflection) -> (color name, size), None if it matches no label.'''
+        if self.table is None:
+            return None
+        r, g, b, l = reading
+        index = self.table[((quantize(r) * BINS + quantize(g)) * BINS + quantize(b)) * BINS + quantize(l)]
+        if index == UNKNOWN:
+            return None
+        return self.labels[index]
+
+    def toDict(self):
+        return {
+            "labels": [list(label) for label in self.labels],
+            "means": self.means,
+            "sigmas": self.sigmas,
+            "samples": [[list(label)] + samples for label, samples in self.samples.items()],
+        }
+
+    def fromDict(self, data):
+        self.labels = [tuple(label) for label in data["labels"]]
+        self.means = data["means"]
+        self.sigmas = data["sigmas"]
+        self.samples = {}
+        for entry in data.get("samples", []):
+            self.samples[tuple(entry[0])] = entry[1:]
+        self.compile()
+
+
+class Vote:
+    '''Sequential test over repeated classifications of the same block.
+
+    Decided as soon as one result leads every other by ``margin`` votes,
+    so a steady block is settled after a few readings while an ambiguous
+    one keeps collecting them.
+    '''
+
+    def __init__(self, margin):
+        self.margin = margin
+        self.votes = {}
+        self.count = 0
+
+    def add(self, result):
+        self.votes[result] = self.votes.get(result, 0) + 1
+        self.count += 1
+        return self.decided()
+
+    def decided(self):
+        ranked = sorted(self.votes.values(), reverse=True) + [0]
+        return ranked[0] - ranked[1] >= self.margin
+
+    def winner(self):
+        best = None
+        for result, votes in self.votes.items():
+            if best is None or votes > self.votes[best]:
+                best = result
+        return best
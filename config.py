@@ -0,0 +1,31 @@
+'''Settings kept in one JSON file on the brick between runs.'''
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+
+class ConfigStore:
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+
+    def load(self):
+        '''Reads the file, an unreadable or missing file gives empty settings.'''
+        try:
+            with open(self.path) as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+        if not isinstance(self.data, dict):
+            self.data = {}
+        return self.data
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump(self.data, f)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
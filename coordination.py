@@ -0,0 +1,186 @@
+'''Reservations of the zones two robots share, so their arms never meet.
+
+Shared zones are numbered the same on both robots (slots). Before an arm
+turns into or across a slot it asks the other robot for it and waits for
+the grant. A robot grants a request straight away unless it holds one of
+the slots, or wants one of them itself and asked first; the grant is then
+sent once it releases them. Requests are ordered by a Lamport clock, ties
+by robot name.
+
+A robot gives up the slots it holds before it asks for new ones, keeping
+only those it asks for again: the one under its arm. The robots ask from
+their pickup zones, which are not shared, and the idle arm waits there,
+so neither waits while holding a slot the other one needs. A robot that
+gets no grant within GRANT_TIMEOUT ms, or whose channel closed, gives
+up on the request; the caller decides what to do without the slots.
+
+Messages are dicts, sent over a channel with send() and receive():
+LocalChannel connects two robots in one program, SocketChannel two bricks.
+'''
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+try:
+    import uerrno as errno
+except ImportError:
+    import errno
+
+REQUEST = "request"
+GRANT = "grant"
+
+GRANT_TIMEOUT = 20000       # ms to wait for a grant, longer than a cycle keeps its route
+
+
+class Coordinator:
+
+    def __init__(self, channel, name, time):
+        self.channel = channel
+        self.name = name            # Has to differ from the other robot's
+        self.time = time            # Returns the time in ms
+        self.clock = 0
+        self.held = set()
+        self.wanted = None          # Slots of the open request
+        self.stamp = None           # (clock, name) of the open request
+        self.deferred = []          # Requests of the other robot waiting for a release
+
+    def holds(self, slots):
+        return set(slots) <= self.held
+
+    def acquireTask(self, slots, abort=None):
+        '''Scheduler task waiting until slots are granted. Held slots not among them are released first.
+
+        Returns False, withdrawing the request, if abort() turns True, the
+        channel closes or no grant comes within GRANT_TIMEOUT ms.
+        '''
+        if self.holds(slots):
+            return True
+        self.release(keep=slots)
+        self.clock += 1
+        self.wanted = set(slots)
+        self.stamp = (self.clock, self.name)
+        self.channel.send({"type": REQUEST, "slots": list(self.wanted), "clock": self.clock, "name": self.name})
+        deadline = self.time() + GRANT_TIMEOUT
+        while self.wanted is not None:
+            if abort is not None and abort() or self.channel.closed or self.time() > deadline:
+                self.wanted = None      # A late grant no longer matches the stamp
+                self.stamp = None
+                return False
+            yield
+        return True
+
+    def release(self, keep=()):
+        '''Gives up every held slot except those in keep.'''
+        self.held = self.held & set(keep)
+        deferred = self.deferred
+        self.deferred = []
+        for request in deferred:
+            self.answer(request)
+
+    def task(self):
+        '''Background task answering the other robot.'''
+        while True:
+            self.poll()
+            yield
+
+    def poll(self):
+        message = self.channel.receive()
+        while message is not None:
+            if message["type"] == REQUEST:
+                self.clock = max(self.clock, message["clock"]) + 1
+                self.answer(message)
+            elif message["type"] == GRANT and self.stamp is not None and message["clock"] == self.stamp[0]:
+                self.held = self.wanted
+                self.wanted = None
+                self.stamp = None
+            message = self.channel.receive()
+
+    def answer(self, request):
+        slots = set(request["slots"])
+        first = self.stamp is not None and self.stamp < (request["clock"], request["name"])
+        if slots & self.held or first and slots & self.wanted:
+            self.deferred.append(request)
+        else:
+            self.channel.send({"type": GRANT, "clock": request["clock"]})
+
+
+class LocalChannel:
+    '''One end of an in-process channel, made by localPair().'''
+
+    def __init__(self):
+        self.inbox = []
+        self.peer = None
+        self.closed = False
+
+    def send(self, message):
+        self.peer.inbox.append(message)
+
+    def receive(self):
+        return self.inbox.pop(0) if self.inbox else None
+
+
+def localPair():
+    first, second = LocalChannel(), LocalChannel()
+    first.peer, second.peer = second, first
+    return first, second
+
+
+class SocketChannel:
+    '''One JSON message per line over a TCP connection.'''
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.connection.setblocking(False)
+        self.buffer = b""
+        self.closed = False         # The other robot hung up or the connection broke
+
+    def send(self, message):
+        if self.closed:
+            return
+        self.connection.setblocking(True)
+        try:
+            self.connection.sendall((json.dumps(message) + "\n").encode())
+        except OSError:
+            self.closed = True
+        self.connection.setblocking(False)
+
+    def receive(self):
+        if b"\n" not in self.buffer and not self.closed:
+            try:
+                data = self.connection.recv(512)
+            except OSError as error:
+                data = None
+                if error.args[0] != errno.EAGAIN:      # Anything but nothing having arrived yet
+                    self.closed = True
+            if data == b"":
+                self.closed = True
+            elif data:
+                self.buffer += data
+        if b"\n" not in self.buffer:
+            return None
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        return json.loads(line)
+
+
+def listen(port):
+    '''Waits for the other robot to connect.'''
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(socket.getaddrinfo("0.0.0.0", port)[0][-1])
+    server.listen(1)
+    connection, address = server.accept()
+    server.close()
+    return SocketChannel(connection)
+
+
+def connect(host, port):
+    connection = socket.socket()
+    connection.connect(socket.getaddrinfo(host, port)[0][-1])
+    return SocketChannel(connection)
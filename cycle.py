@@ -0,0 +1,36 @@
+'''Checkpoint of the sort cycle, so a cycle cut short carries on at the step it was at.
+
+A cycle goes PICKING (to the pickup zone and grip), SENSING (lift the
+block past the sensor), DROPPING (to its zone, or back to the pickup
+zone) and ends at DONE. The robot only moves the checkpoint on once a
+step has finished. Every step starts by moving to where it works, so a
+step an emergency stop cut short is simply run again from its start
+after recovery, with the block it holds and the targets it had.
+'''
+
+# Steps, the names differ from the tracer's phases
+PICKING = 0
+SENSING = 1
+DROPPING = 2
+DONE = 3
+STEPS = ["pick", "sense", "drop", "done"]
+
+
+class Cycle:
+
+    def __init__(self, pickup):
+        self.step = PICKING
+        self.pickup = pickup        # Index of the zone the block is picked up at
+        self.holding = False        # The gripper holds the block
+        self.color = None           # Color and size of the block once sensed
+        self.size = None
+        self.drop = None            # Index of the zone it goes to, None puts it back
+        self.start = None           # Tracer start of the grip to drop time
+
+    def toDict(self):
+        return {
+            "step": STEPS[self.step],
+            "pickup": self.pickup,
+            "holding": self.holding,
+            "drop": self.drop,
+        }
@@ -0,0 +1,205 @@
+'''Status page and remote controls served over HTTP while the robot runs (US19).
+
+    GET  /          page showing the state and following the events
+    GET  /state     current state as JSON
+    GET  /events    server-sent events published from then on
+    POST /control?action=start|pause|resume|color[&zone=N&color=Red]   (N from 1, as in the menu)
+
+Every socket is non-blocking and poll() does a bounded amount of work:
+at most one new connection, one read and one write of CHUNK bytes per
+connection. Published events go into a ring buffer of SIZE, a browser
+that falls behind misses events instead of holding up the robot.
+Controls are only queued here, the robot takes them at the safe points
+of its cycle.
+'''
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+try:
+    import uerrno as errno
+except ImportError:
+    import errno
+
+POLL_EVERY = 50             # ms between polls of the sockets
+SIZE = 32                   # Events kept for the event streams
+MAX_CLIENTS = 4
+MAX_REQUEST = 1024          # Bytes of request line and headers, longer requests are refused
+MAX_CONTROLS = 8            # Controls queued at most, more are refused until the robot takes some
+CHUNK = 1024                # Bytes read or written per connection and poll
+
+ACTIONS = ("start", "pause", "resume", "color")
+
+PAGE = '''<!DOCTYPE html>
+<html><head><title>Sorter</title></head><body>
+<button onclick="send('start')">Start</button>
+<button onclick="send('pause')">Pause</button>
+<button onclick="send('resume')">Resume</button>
+Zone <input id="zone" type="number" min="1" size="2" value="1">
+<select id="color"><option>Red<option>Green<option>Blue<option>Yellow</select>
+<button onclick="send('color&zone=' + zone.value + '&color=' + color.value)">Set color</button>
+<pre id="state"></pre><pre id="events"></pre>
+<script>
+function send(action) { fetch('/control?action=' + action, {method: 'POST'}); }
+function refresh() {
+    fetch('/state').then(r => r.json()).then(s => { state.textContent = JSON.stringify(s, null, 1); });
+}
+new EventSource('/events').onmessage = m => {
+    events.textContent = (m.data + '\\n' + events.textContent).slice(0, 4000);
+    refresh();
+};
+refresh();
+</script></body></html>
+'''
+
+
+class EventBuffer:
+    '''The last size events, numbered in the order they were added.'''
+
+    def __init__(self, size=SIZE):
+        self.events = [None] * size
+        self.next = 0               # Number of the next event
+
+    def add(self, kind, data):
+        self.events[self.next % len(self.events)] = (self.next, kind, data)
+        self.next += 1
+
+    def since(self, number):
+        '''Events numbered number or later that are still kept, oldest first.'''
+        first = max(number, self.next - len(self.events))
+        return [self.events[n % len(self.events)] for n in range(first, self.next)]
+
+
+class Connection:
+
+    def __init__(self, connection):
+        self.socket = connection
+        self.socket.setblocking(False)
+        self.request = b""
+        self.output = b""
+        self.stream = None          # Number of the next event to send, None unless it is an event stream
+        self.closing = False        # Close once the output is sent
+
+
+class Dashboard:
+
+    def __init__(self, port, state):
+        self.state = state          # Returns the robot's state as a dict, only called for /state
+        self.events = EventBuffer()
+        self.controls = []          # Queued controls, oldest first, taken by the robot
+        self.connections = []
+        self.server = socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(socket.getaddrinfo("0.0.0.0", port)[0][-1])
+        self.server.listen(MAX_CLIENTS)
+        self.server.setblocking(False)
+
+    def publish(self, kind, data):
+        '''Adds an event for the event streams, data is a dict.'''
+        self.events.add(kind, data)
+
+    def close(self):
+        for connection in self.connections:
+            connection.socket.close()
+        self.connections = []
+        self.server.close()
+
+    def poll(self):
+        if len(self.connections) < MAX_CLIENTS:
+            try:
+                connection, address = self.server.accept()
+                self.connections.append(Connection(connection))
+            except OSError:         # Nobody is connecting
+                pass
+        for connection in self.connections[:]:
+            if not self.serve(connection):
+                connection.socket.close()
+                self.connections.remove(connection)
+
+    def serve(self, connection):
+        '''Reads and writes one chunk. Returns False once the connection is done.'''
+        try:
+            data = connection.socket.recv(CHUNK)
+            if not data:            # Closed by the browser
+                return False
+        except OSError as error:
+            if error.args[0] != errno.EAGAIN:
+                return False
+            data = None
+        if data and connection.stream is None and not connection.closing:
+            connection.request += data
+            if b"\r\n\r\n" in connection.request:
+                self.handle(connection)
+            elif len(connection.request) > MAX_REQUEST:
+                self.respond(connection, "413 Payload Too Large", "text/plain", "Request too long")
+
+        if connection.stream is not None and not connection.output:
+            events = self.events.since(connection.stream)
+            if events:
+                lost = events[0][0] - connection.stream
+                connection.output = b"".join(self.encode(*event) for event in events)
+                if lost:
+                    connection.output = self.encode(connection.stream, "lost", {"count": lost}) + connection.output
+                connection.stream = events[-1][0] + 1
+
+        if connection.output:
+            try:
+                sent = connection.socket.send(connection.output[:CHUNK])
+            except OSError as error:
+                if error.args[0] != errno.EAGAIN:
+                    return False
+                sent = 0
+            connection.output = connection.output[sent:]
+        return not (connection.closing and not connection.output)
+
+    def encode(self, number, kind, data):
+        return ("id: %d\ndata: {\"kind\": \"%s\", \"data\": %s}\n\n" % (number, kind, json.dumps(data))).encode()
+
+    def handle(self, connection):
+        line = connection.request.split(b"\r\n", 1)[0].decode()
+        parts = line.split(" ")
+        method = parts[0]
+        target = parts[1] if len(parts) > 1 else ""
+        path, query = target.split("?", 1) if "?" in target else (target, "")
+
+        if method == "GET" and path == "/":
+            self.respond(connection, "200 OK", "text/html", PAGE)
+        elif method == "GET" and path == "/state":
+            self.respond(connection, "200 OK", "application/json", json.dumps(self.state()))
+        elif method == "GET" and path == "/events":
+            connection.output = b"HTTP/1.0 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n\r\n"
+            connection.stream = self.events.next
+        elif method == "POST" and path == "/control":
+            control = parseQuery(query)
+            if control.get("action") not in ACTIONS:
+                self.respond(connection, "400 Bad Request", "text/plain", "Unknown action")
+            elif len(self.controls) >= MAX_CONTROLS:
+                self.respond(connection, "503 Service Unavailable", "text/plain", "Too many queued controls")
+            else:
+                self.controls.append(control)
+                self.respond(connection, "202 Accepted", "application/json", json.dumps(control))
+        else:
+            self.respond(connection, "404 Not Found", "text/plain", "Not found")
+
+    def respond(self, connection, status, content_type, body):
+        body = body.encode()
+        connection.output = ("HTTP/1.0 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: close\r\n\r\n"
+                             % (status, content_type, len(body))).encode() + body
+        connection.closing = True
+
+
+def parseQuery(query):
+    '''Dict of the name=value pairs of a query string, values are not unescaped.'''
+    values = {}
+    for pair in query.split("&"):
+        if "=" in pair:
+            name, value = pair.split("=", 1)
+            values[name] = value
+    return values
@@ -0,0 +1,40 @@
+'''Retained-mode drawing on the EV3 screen.
+
+A screen is a dict of lines, y -> tuple of (x, text, inverted) segments.
+show() compares it with what is already on the screen: a screen with the
+same line positions only gets the changed lines cleared and redrawn, any
+other screen is drawn from a cleared display.
+'''
+
+from pybricks.parameters import Color
+
+LINE_HEIGHT = 20
+
+
+class Display:
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.shown = None       # Lines on the screen, None before the first show()
+
+    def show(self, lines):
+        shown = self.shown
+        if shown is None or sorted(shown) != sorted(lines):
+            self.screen.clear()
+            shown = {}
+        for y in sorted(lines):
+            segments = lines[y]
+            if shown.get(y) == segments:
+                continue
+            if y in shown:
+                self.screen.draw_box(0, y, self.screen.width - 1, y + LINE_HEIGHT - 1, fill=True, color=Color.WHITE)
+            for x, text, inverted in segments:
+                if inverted:
+                    self.screen.draw_text(x, y, text, text_color=Color.WHITE, background_color=Color.BLACK)
+                else:
+                    self.screen.draw_text(x, y, text)
+        self.shown = dict(lines)
+
+    def showText(self, rows):
+        '''Shows (y, text) rows, starting at the left edge and not highlighted.'''
+        self.show({y: ((0, text, False),) for y, text in rows})
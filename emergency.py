@@ -0,0 +1,47 @@
+'''Emergency stop monitor: holds every motor within a few ms of the stop input.
+
+check() samples the stop input at most every CHECK_EVERY ms. The
+scheduler calls it before it resumes each task and before it sleeps, and
+the few loops that run outside the scheduler call it themselves, so the
+time from the input to the motors holding is bounded by the longest
+single step of a task instead of by a whole move or wait. The monitor
+only halts the motors; moving the arm somewhere safe is a separate
+recovery step the robot takes once the operator confirms it.
+'''
+
+CHECK_EVERY = 5             # ms between samples of the stop input
+KEEP = 16                   # Latencies kept for the log
+
+
+class StopMonitor:
+
+    def __init__(self, triggered, motors, clock, halted):
+        self.triggered = triggered      # Returns True while the stop input is active
+        self.motors = motors
+        self.clock = clock              # Returns the time in ms
+        self.halted = halted            # Called with the latency once the motors hold
+        self.last = None                # Time of the last sample
+        self.active = False             # The input was active at the last sample
+        self.latencies = []             # ms from the stop input to the motors holding, newest last
+
+    def check(self):
+        now = self.clock()
+        if self.last is not None and now - self.last < CHECK_EVERY:
+            return
+        since = self.last if self.last is not None else now
+        self.last = now
+        active = self.triggered()
+        if active and not self.active:
+            self.halt(since)
+        self.active = active
+
+    def halt(self, since):
+        '''Holds every motor. The latency is measured from since, the last time the
+        input was seen inactive, so it is an upper bound.'''
+        for motor in self.motors:
+            motor.hold()
+        latency = self.clock() - since
+        if len(self.latencies) >= KEEP:
+            self.latencies.pop(0)
+        self.latencies.append(latency)
+        self.halted(latency)
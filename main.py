@@ -3,15 +3,34 @@
 from pybricks.hubs import EV3Brick
 from pybricks.ev3devices import Motor, TouchSensor, ColorSensor
 from pybricks.parameters import Port, Stop, Direction, Color, Button
-from pybricks.tools import wait
+
+from belt import BeltTracker
+from buttons import ButtonEvents, PRESS, RELEASE, LONG_PRESS
+from classifier import ColorClassifier, Vote
+from config import ConfigStore
+from coordination import Coordinator, connect, listen
+from cycle import Cycle, PICKING, SENSING, DROPPING, DONE
+from dashboard import Dashboard, POLL_EVERY
+from emergency import StopMonitor
+from display import Display
+from polling import PollInterval
+from recorder import Recorder, RecordedButtons, RecordedSensor
+from scheduler import Scheduler
+from timetable import SortSchedule
+from tracer import Tracer, CYCLE, OPEN, LIFT, ROTATE, DESCEND, GRIP, SENSOR, DROP, RETURN, WAIT
+from trajectory import ClearanceTable, LOADED, limits
+from zones import ZoneMap, PickupPlanner
 
 MAX_BASE_ANGLE = 260        # NOTE: Set the angle to an apropriate value
 
 BASE_MOTOR_SPEED = 150
 GRIPPER_MOTOR_SPEED = 200
 ELBOW_MOTOR_SPEED = 60
+RECOVERY_SLOWDOWN = 4       # Times slower the arm moves after an emergency stop
 
-ZONE_ANGLES = [0, 100, 150, 200]
+ZONE_ANGLES = [0, 100, 150, 200]      # Any number of zones, the menu lists as many as there are
+ZONE_COLORS = [Color.RED, Color.RED, Color.BLUE, Color.GREEN]   # Random default colors
+PICKUP_ZONES = [0]          # Indexes of the zones blocks arrive at
 
 SENSOR_HIGHT = 63
 TOP_HIGHT = 77
@@ -20,8 +39,58 @@ ELEVATED_HEIGHT = 58
 
 BASESWITCH_OFFSET = 15
 
+GRIPPER_OPEN_ANGLE = -86
+GRIPPER_PROBE_WIDE = -45    # Just wider than the biggest block, how far the jaws open for a probing grab
+GRIPPER_PROBE_ANGLE = -10   # Narrower than the smallest block, jaws that get here are empty
+GRIP_STOP_SPEED = 40        # deg/s the closing jaws drop below once they press on a block
+GRIP_READINGS = 2           # Readings in a row below GRIP_STOP_SPEED that count as holding a block
+GRIP_DUTY = {"BIG": 45, "SMALL": 30, "UNKNOWN": 35}    # % duty the jaws squeeze a held block of each size with
+CLEARANCE = TOP_HIGHT - ELEVATED_HEIGHT     # Elbow angle above a zone's hight needed to pass over it
+ZONE_WIDTH = 10                             # Base degrees either side of a zone's angle it takes up
+TARGET_TOLERANCE = 5                        # Degrees from target that count as arrived
+
+
+HOMING_SLOW = 15            # deg/s the base re-touches its switch at after the fast approach
+HOMING_BACKOFF = 4          # Base degrees before where the fast approach hit the switch the slow re-touch starts from
+
+CONFIG_FILE = "config.json"     # Zones, times, calibration and the arm position at the last shutdown
+WARM_MARGIN = 5             # Base degrees before the switch the warm start check slows down at
+WARM_TOLERANCE = 3          # Base degrees the switch may be off by before the warm start falls back to homing
+CALIBRATION_SAMPLES = 20
+CALIBRATION_SETTLE = 300    # ms to let the block stop swinging before calibration samples
+
+COLOR_MARGIN = 3            # Votes one reading has to lead by before getColor trusts it
+COLOR_MAX_SAMPLES = 15
+COLOR_MAX_TIME = 200        # ms
+REFLECTION_EVERY = 4        # rgb readings per reflection reading, switching sensor mode is slow
+SENSOR_WINDOW = 4           # Elbow degrees either side of sensor_hight where the sensor sees the block
+SENSOR_KEEP = 5             # Readings closest to sensor_hight that decide a reading taken on the move
+
+POLL_STEP = 500             # ms the menu changes the check interval bounds by
+
+IDLE_POLICIES = ["Top", "Hover"]    # Where the arm waits when every pickup zone is empty
+HOVER_OFFSET = 8            # Elbow degrees above the pickup zone's hight the Hover policy waits at
+
+MENU_ROWS = 5               # Menu items that fit below the title
+
+STOP_BUTTON = Button.RIGHT  # Brick button that stops every motor straight away
+STOP_SWITCH = None          # Port of a touch sensor wired as a stop button, None without one
+
+TRACE = False               # Record phase timings from the start, the menu can turn it on and off
+TRACE_FILE = "trace.txt"
 
-DEBOUNCE_TIME = 300         # Wait time after a button press so it only get's registered once
+RECORD = False              # Log motor commands, sensor readings and buttons for sim/replay.py
+RECORD_FILE = "record.bin"
+
+BELT_ZONE = None            # Pickup zone a conveyor belt runs under (US17), None without a belt
+BELT_SENSORS = (Port.S3, Port.S4)   # Color sensors looking at the belt, the one farther upstream first
+BELT_DISTANCES = (200, 100) # mm from each belt sensor to the pickup zone
+LEAD_WEIGHT = 0.3           # Weight of the newest measured descend/grab time in the interception leads
+
+PARTNER = None              # (host, port) of the other robot in the cell, (None, port) to wait for it to connect
+SHARED_ZONES = []           # Indexes of the zones the other robot reaches too, in the same order on both robots
+
+DASHBOARD_PORT = None       # Port the status page and remote controls are served on (US19), None to leave them off
 
 
 def formatColor(color):
@@ -67,18 +136,40 @@ class Zone:
 
 class Robot:
     inEmergency = False
-    afterEmergency = False
     menu = True
-    pickUpIndex = 0
-    wait_time = 3000                # Time between periodic checks
-    time_to_start = 0
+    pickUpIndex = 0                 # Pickup zone the current block came from
+    wait_time = 3000                # Longest time between periodic checks
+    min_wait_time = 500             # Shortest time between periodic checks
+    time_to_start = 0               # Seconds before sorting starts, or before an added window starts
+    run_for = 0                     # Seconds an added window lasts, 0 until stopped
+    repeat_every = 0                # Seconds between starts of an added window, 0 runs once
     sensor_hight = SENSOR_HIGHT     
     top_hight = TOP_HIGHT           # Hight of claw so it doesn't hit elevated objects
+    color_sampling = True           # Read the sensor until the result is certain instead of once
+    presence_probe = True           # Stop closing the gripper as soon as it is known to be empty
+    last_reflection = None
+    zones = ZoneMap()
+    paused = False
+    emergency = False               # The motors were stopped, set until recover() ran. Moves end early and none start
+    cycle = None                    # Checkpoint of the sort cycle in progress
+    busy = 0                        # Number of moves/waits running that CENTER can pause
+    idle_policy = 0                 # Index into IDLE_POLICIES
+    coordinator = None              # Reserves shared zones with the other robot, None when working alone
+    belt = None                     # BeltTracker when a pickup zone is on a conveyor belt
+    descend_lead = 500              # ms from hovering over the belt to the jaws at the block's hight
+    close_lead = 150                # ms from starting to close the jaws to holding the block
+    display_dirty = False
+    display_text = ("No Block", "No Block")
+    current_color = "No Block"
+    current_size = "No Block"
+    dashboard = None                # Dashboard while DASHBOARD_PORT is set
+    start_requested = False         # The dashboard asked to start sorting
 
     # region Initialize
 
     def __init__(self, base_offset) -> None:
         self.ev3 = EV3Brick()
+        self.display = Display(self.ev3.screen)
         self.gripper_motor = Motor(Port.A)
         self.elbow_motor = Motor(Port.B, Direction.COUNTERCLOCKWISE, [8, 40])
         self.base_motor = Motor(Port.C, Direction.COUNTERCLOCKWISE, [12, 36])
@@ -87,168 +178,539 @@ class Robot:
         self.elbow_sensor = ColorSensor(Port.S2)
         self.elbow_motor.control.limits(speed=ELBOW_MOTOR_SPEED, acceleration=120)
         self.base_motor.control.limits(speed=BASE_MOTOR_SPEED, acceleration=200)
+        self.default_limits = {
+            self.elbow_motor: (ELBOW_MOTOR_SPEED, 120),
+            self.base_motor: (BASE_MOTOR_SPEED, 200),
+        }
+        self.limits = dict(self.default_limits)
+        self.clearances = ClearanceTable()
+        self.classifier = ColorClassifier()
+        self.pickups = list(PICKUP_ZONES)
+        self.pickUpIndex = self.pickups[0]
+        self.planner = PickupPlanner()
+        self.poll = PollInterval()
+        self.schedule = SortSchedule()
+        self.config = ConfigStore(CONFIG_FILE)
+        self.config.load()
+        self.loadCalibration()
+        self.scheduler = Scheduler()
+        self.recorder = Recorder(self.scheduler.time, RECORD_FILE)
+        self.elbow_sensor = RecordedSensor(self.elbow_sensor, self.recorder, Port.S2)
+        self.motor_ids = {self.gripper_motor: 0, self.elbow_motor: 1, self.base_motor: 2}     # Motor numbers in the log
+        self.route = set()          # Shared zone slots reserved for the current cycle
+        self.counters = {"sorted": 0, "returned": 0}
+
+        self.buttons = ButtonEvents(RecordedButtons(self.ev3.buttons, self.recorder), self.scheduler.time)
+        self.tracer = Tracer(self.scheduler.time)
+        self.tracer.enabled = TRACE
+        stop_switch = TouchSensor(STOP_SWITCH) if STOP_SWITCH is not None else None
+        self.stop_monitor = StopMonitor(
+            lambda: STOP_BUTTON in self.ev3.buttons.pressed() or stop_switch is not None and stop_switch.pressed(),
+            [self.gripper_motor, self.elbow_motor, self.base_motor], self.scheduler.time, self.halted)
+        self.scheduler.monitor = self.stop_monitor.check       # Watches the stop input from homing on
+        self.scheduler.spawn(self.buttons.task())
+        self.scheduler.spawn(self.buttonTask())
+        self.scheduler.spawn(self.displayTask())
+
+        pose = self.config.get("pose")
+        while not (pose and self.warmStart(pose, base_offset) or self.home(base_offset)):
+            self.confirmHoming()        # An emergency stop cut homing short, home from scratch
+            pose = None
+        self.config.data["pose"] = None     # Only a clean shutdown makes the next start a warm one
+        self.config.save()
+
+        if DASHBOARD_PORT is not None:
+            self.dashboard = Dashboard(DASHBOARD_PORT, self.dashboardState)
+            self.scheduler.spawn(self.dashboardTask())
+        if BELT_ZONE is not None:
+            sensors = [RecordedSensor(ColorSensor(port), self.recorder, port) for port in BELT_SENSORS]
+            self.belt = BeltTracker(sensors, BELT_DISTANCES, self.scheduler.time)
+            self.scheduler.spawn(self.belt.task())
+        if RECORD:
+            self.recorder.start()
+
+
+    def home(self, switch_offset):
+        '''Finds the zero of every motor and prints the time it took. Returns False if an emergency stop cut it short.'''
+        start = self.scheduler.time()
+        if not self.homingRun(self.homeTask(switch_offset)):
+            return False
+        homing_time = self.scheduler.time() - start
+        self.config.data["homing"] = {"time": homing_time}
+        print("Homed in", homing_time, "ms")
+        return True
+
+    def homingRun(self, task):
+        '''Runs a homing task with the long CENTER press armed like during a move.'''
+        self.busy += 1
+        try:
+            return self.run(task)
+        finally:
+            self.busy -= 1
 
-        self.initGripper()
-        self.initElbow()
-        self.initBase(base_offset)
-
+    def confirmHoming(self):
+        '''Waits for the stop input to be released and CENTER after an emergency stop during homing.'''
+        self.inEmergency = True
+        self.display.showText([(0, "Emergency Stop"), (30, "Release stop,"), (50, "Center: home")])
+        self.run(self.confirmTask())
+        self.emergency = False
+        self.paused = False
+        self.inEmergency = False
 
-    def initGripper(self):
+    def homeTask(self, switch_offset):
+        '''Homes the gripper alongside the elbow, the base turns once the elbow is at top_hight.
+        Returns False if an emergency stop cut it short.'''
+        gripper = self.scheduler.spawn(self.homeGripperTask())
+        homed = (yield from self.homeElbowTask()) and (yield from self.homeBaseTask(switch_offset))
+        return (yield gripper) and homed
+
+    def untilTask(self, done):
+        '''Yields until done() is True. Returns False if an emergency stop came first.'''
+        while not done():
+            if self.emergency:
+                return False
+            yield
+        return not self.emergency
+
+    def stallTask(self, motor, speed, duty_limit):
+        '''Runs a motor until it stalls, like run_until_stalled without blocking the other motors.'''
+        actuation = motor.control.limits()[2]
+        motor.control.limits(actuation=duty_limit)
+        motor.run(speed)
+        stalled = yield from self.untilTask(motor.control.stalled)
+        if stalled:
+            motor.stop()
+        motor.control.limits(actuation=actuation)
+        return stalled
+
+    def homeGripperTask(self):
         # Initialize gripper with closed grip as 0 degrees
-        self.gripper_motor.run_until_stalled(GRIPPER_MOTOR_SPEED, then=Stop.COAST, duty_limit=50)
+        if not (yield from self.stallTask(self.gripper_motor, GRIPPER_MOTOR_SPEED, 50)):
+            return False
         self.gripper_motor.reset_angle(0)
-        self.gripper_motor.run_target(GRIPPER_MOTOR_SPEED, -90, then=Stop.COAST)      # Leave the gripper open
+        self.gripper_motor.run_target(GRIPPER_MOTOR_SPEED, -90, then=Stop.COAST, wait=False)      # Leave the gripper open
+        if not (yield from self.untilTask(self.gripper_motor.control.done)):
+            return False
         self.gripper_motor.control.stall_tolerances(50,10)
+        return True
 
-    def initElbow(self):
-        # Initialize the elbow motor
-        self.elbow_motor.run_until_stalled(-ELBOW_MOTOR_SPEED, then=Stop.HOLD, duty_limit=20)
+    def homeElbowTask(self):
+        if not (yield from self.stallTask(self.elbow_motor, -ELBOW_MOTOR_SPEED, 20)):
+            return False
+        self.elbow_motor.hold()
         self.elbow_motor.reset_angle(0)
-        self.elbow_motor.run_target(ELBOW_MOTOR_SPEED, self.top_hight, then=Stop.HOLD)
-
-    def initBase(self, switch_offset):
-        # Initialize base motot to where the switch is pressed with an offset
-        self.base_motor.run(-BASE_MOTOR_SPEED/2)
+        self.elbow_motor.run_target(ELBOW_MOTOR_SPEED, self.top_hight, then=Stop.HOLD, wait=False)
+        return (yield from self.untilTask(lambda: self.elbow_motor.angle() >= self.top_hight - TARGET_TOLERANCE))
+
+    def homeBaseTask(self, switch_offset):
+        '''Finds the base switch at full speed, then touches it again slowly.
+
+        The fast approach holds the moment the switch is pressed. The slow
+        touch starts HOMING_BACKOFF before the angle it was pressed at, so
+        it starts off the switch however far the base overran. Zero is
+        switch_offset past the slow touch. Returns False if an emergency
+        stop cut it short.
+        '''
+        self.base_motor.run(-BASE_MOTOR_SPEED)
+        if not (yield from self.untilTask(self.base_switch.pressed)):
+            return False
+        pressed_at = self.base_motor.angle()
+        self.base_motor.hold()
+
+        self.base_motor.run_target(BASE_MOTOR_SPEED, pressed_at + HOMING_BACKOFF, then=Stop.HOLD, wait=False)
+        if not (yield from self.untilTask(self.base_motor.control.done)):
+            return False
+        self.base_motor.run(-HOMING_SLOW)
+        if not (yield from self.untilTask(self.base_switch.pressed)):
+            return False
+        self.base_motor.hold()
+
+        self.base_motor.reset_angle(-switch_offset)
+        self.base_motor.run_target(BASE_MOTOR_SPEED, 0, then=Stop.COAST, wait=False)
+        return (yield from self.untilTask(self.base_motor.control.done))
+
+    def warmStart(self, pose, switch_offset):
+        '''Takes the motor angles stored at the last shutdown instead of homing.
+
+        Checks them by turning the base from the pickup zone shutdown() parked
+        it over back onto its switch, slowly for the last WARM_MARGIN degrees.
+        Returns False if the switch is not where the stored angle says, then
+        the robot has to home. The elbow is homed first all the same, so the
+        base never turns with it low.
+        '''
+        return self.homingRun(self.warmStartTask(pose, switch_offset))
+
+    def warmStartTask(self, pose, switch_offset):
+        self.gripper_motor.reset_angle(pose["gripper"])
+        self.base_motor.reset_angle(pose["base"])
+        self.gripper_motor.control.stall_tolerances(50,10)
+        if self.base_switch.pressed():
+            return False
+        if not (yield from self.homeElbowTask()):       # The elbow coasts at shutdown and may have sagged since
+            return False
+
+        switch_angle = -switch_offset
+        self.base_motor.run_target(BASE_MOTOR_SPEED, switch_angle + WARM_MARGIN, then=Stop.HOLD, wait=False)
+        if not (yield from self.untilTask(self.base_motor.control.done)):
+            return False
+        self.base_motor.run(-BASE_MOTOR_SPEED/4)
         while not self.base_switch.pressed():
-            wait(10)
-        self.base_motor.reset_angle(0)
-        self.base_motor.run_target(BASE_MOTOR_SPEED, switch_offset, then=Stop.COAST)
-        self.base_motor.reset_angle(0)
-
+            if self.emergency:
+                return False
+            if self.base_motor.angle() < switch_angle - WARM_TOLERANCE:
+                self.base_motor.stop()
+                return False
+            yield
+        if abs(self.base_motor.angle() - switch_angle) > WARM_TOLERANCE:
+            self.base_motor.stop()
+            return False
+        self.base_motor.reset_angle(switch_angle)
+        self.base_motor.run_target(BASE_MOTOR_SPEED, 0, then=Stop.COAST, wait=False)
+        return (yield from self.untilTask(self.base_motor.control.done))
+
+    def shutdown(self):
+        '''Parks the arm and stores its position so the next start can skip homing.'''
+        self.moveArm(base=self.zones[self.pickUpIndex], elbow=self.top_hight, gripper=GRIPPER_OPEN_ANGLE)
+        self.saveConfig(pose={
+            "gripper": self.gripper_motor.angle(),
+            "base": self.base_motor.angle(),
+        })
+        if self.dashboard is not None:
+            self.dashboard.close()
+
+
+    def run(self, task):
+        '''Runs a task on the scheduler. After an emergency stop the task's moves end early.'''
+        return self.scheduler.run(task)
+
+    def setLimits(self, motor, speed, acceleration):
+        '''Changes a motor's control limits, only stopping it if they differ.'''
+        if self.limits.get(motor) != (speed, acceleration):
+            motor.stop()
+            motor.control.limits(speed=speed, acceleration=acceleration)
+            self.limits[motor] = (speed, acceleration)
 
     def runMotor(self, motor, speed, target, stop_action=Stop.HOLD):
+        '''Returns False if an emergency stop cut the move short or kept it from starting.'''
+        if self.emergency:
+            return False
+        if motor in self.default_limits:
+            self.setLimits(motor, *self.default_limits[motor])
+        self.run(self.motorTask(motor, speed, target, stop_action))
+        return not self.emergency
+
+    def motorTask(self, motor, speed, target, stop_action=Stop.HOLD):
+        '''Drives one motor to target, holding it while paused.'''
+        moves = {motor: (speed, target, stop_action)}
+        self.recorder.motor(self.motor_ids[motor], speed, target)
         motor.stop()
-        if not self.afterEmergency:
-            motor.run_target(speed, target, then=stop_action, wait=False)
-            while not(motor.angle() < target + 5 and motor.angle() > target -5):
-                wait(50)
-                if Button.CENTER in self.ev3.buttons.pressed() and not self.inEmergency:
-                    motor.hold()
-                    hold_time = 0
-                    while Button.CENTER in self.ev3.buttons.pressed() and hold_time < 2000:
-                        wait(50)
-                        hold_time += 50
-
-                    
-                    if hold_time >= 2000:
-                        self.emergencyStop()
-                        return
-                    else:
-                        self.pauseMenu()
-                        wait(DEBOUNCE_TIME)
-                        while True:
-                            button_press = self.ev3.buttons.pressed()
-                            if Button.DOWN in button_press:
-                                wait(DEBOUNCE_TIME)
-                                self.menu = True
-                            if Button.CENTER in button_press:
-                                wait(DEBOUNCE_TIME)
-                                self.runtimeDisplay(color=self.current_color, size=self.current_size)
-                                self.runMotor(motor, speed, target, stop_action)
-                                return
-                            wait(50)
-        
-
-
-    def stallMotor(self, motor, speed, target, stop_action=Stop.HOLD):
-        motor.stop()
-        if not self.afterEmergency:
-            print(self.gripper_motor.control.stall_tolerances())
-            motor.run_target(speed, target, then=stop_action, wait=False)
-            while not motor.control.stalled() and not(motor.angle() < target + 5 and motor.angle() > target -5):
-                wait(50)
-                if Button.CENTER in self.ev3.buttons.pressed():
-                    motor.stop()
-
-                    hold_time = 0
-                    while Button.CENTER in self.ev3.buttons.pressed() and hold_time < 2000:
-                        wait(50)
-                        hold_time += 50
-
-                    
-                    if hold_time >= 2000:
-                        self.emergencyStop()
-                        return
-                    else:
-                        self.pauseMenu()
-                        wait(DEBOUNCE_TIME)
-                        while True:
-                            # FIX:: Draw instructions here, Maybe put the motor on coast
-                            button_press = self.ev3.buttons.pressed()
-                            if Button.DOWN in button_press:
-                                wait(DEBOUNCE_TIME)
-                                self.menu = True
-                            if Button.CENTER in button_press:
-                                wait(DEBOUNCE_TIME)
-                                self.runtimeDisplay(color=self.current_color, size=self.current_size)
-                                self.stallMotor(motor, speed, target, stop_action)
-                                return
-                            wait(50)
-            motor.hold()
-
+        motor.run_target(speed, target, then=stop_action, wait=False)
+        self.busy += 1
+        try:
+            while abs(motor.angle() - target) >= TARGET_TOLERANCE:
+                yield
+                if not (yield from self.holdWhilePaused(moves)):
+                    return
+        finally:
+            self.busy -= 1
+
+
+    def buttonTask(self):
+        '''Background task: a CENTER press pauses, a long press is an emergency stop like STOP_BUTTON.
+
+        Once CENTER is released the pause screen shows, DOWN then opens the
+        menu after the current move and CENTER resumes.
+        '''
+        holding = False         # CENTER is still down from the press that paused
+        while True:
+            yield
+            if not (self.busy or self.paused) or self.inEmergency or self.emergency:
+                continue
+            event = self.buttons.get()
+            if event is None:
+                continue
+
+            kind, button, time = event
+            if not self.paused:
+                holding = kind == PRESS and button == Button.CENTER
+                self.paused = holding
+            elif holding:
+                if button == Button.CENTER and kind == LONG_PRESS:
+                    holding = False
+                    self.stop_monitor.halt(time)
+                elif button == Button.CENTER and kind == RELEASE:
+                    holding = False
+                    self.pauseMenu()
+            elif kind == PRESS and button == Button.DOWN:
+                self.menu = True
+            elif kind == PRESS and button == Button.CENTER:
+                self.runtimeDisplay(color=self.current_color, size=self.current_size)
+                self.paused = False
+
+    def displayTask(self):
+        '''Background task: redraws the runtime screen after runtimeDisplay() changed it.'''
+        while True:
+            yield
+            if self.display_dirty and not self.paused:
+                self.display_dirty = False
+                self.drawRuntime()
+
+    def holdWhilePaused(self, moves):
+        '''Holds the motors while paused and restarts their moves on resume.
+
+        moves maps motor -> (speed, target, stop_action). Returns False if an
+        emergency stop was requested instead.
+        '''
+        if self.paused:
+            for motor in moves:
+                motor.hold()
+            while self.paused and not self.emergency:
+                yield
+            if not self.emergency:
+                for motor, (speed, target, stop_action) in moves.items():
+                    motor.run_target(speed, target, then=stop_action, wait=False)
+        if self.emergency:
+            for motor in moves:
+                motor.hold()
+            return False
+        return True
 
     def pauseMenu(self):
-        self.ev3.screen.clear()
-        self.ev3.screen.draw_text(0, 0, "Paused")
-        self.ev3.screen.draw_text(0, 50, "To Resume")
-        self.ev3.screen.draw_text(0, 70, "Press Center")
+        self.display.showText([(0, "Paused"), (50, "To Resume"), (70, "Press Center")])
 
     def closestZone(self):
-        current = self.base_motor.angle()
-        return min(range(len(ZONE_ANGLES)), key=lambda i: abs(ZONE_ANGLES[i] - current))
-            
-
-    def emergencyStop(self):
+        return self.zones.nearest(self.base_motor.angle())
+
+    def zoneAt(self, angle):
+        '''Index of the zone the base is at, None if it is between zones.'''
+        index = self.zones.nearest(angle)
+        if index is not None and abs(self.zones[index].angle - angle) <= TARGET_TOLERANCE:
+            return index
+        return None
+
+    def zonesChanged(self):
+        '''Rebuilds the zone lookups and the clearance table after a zone was edited, and stores
+        the zones right away so a start after a power loss does not use the old ones.'''
+        if self.pickUpIndex not in self.pickups:
+            self.pickUpIndex = self.pickups[0]
+        self.zones.reindex(self.pickups)
+        self.buildMenus(self.zones)
+        self.planner.reset()
+        self.clearances.build(self.zones, self.pathClearance)
+        self.saveConfig()
+
+    def halted(self, latency):
+        '''Called by the StopMonitor once every motor holds. Moves still running end
+        and no new ones start until recover().'''
+        self.emergency = True
+        self.paused = False
+        print("Emergency stop, motors held", latency, "ms after the stop input")
+        self.publish("emergency", {"latency": latency})
+
+    def partnerLost(self):
+        '''The other robot did not grant the way in time or hung up: stops like the emergency stop.'''
+        print("No grant from the other robot, stopping")
+        self.stop_monitor.halt(self.scheduler.time())
+
+    def recover(self):
+        '''Second step of an emergency stop: once the stop input is released and CENTER
+        pressed, slowly takes the arm over the closest zone and opens the menu.
+
+        Without a block in the gripper the arm is put down there and the
+        gripper opened, as something may be stuck in it. A held block is
+        kept. The cycle keeps its checkpoint, Resume in the menu carries it on.
+        '''
         self.inEmergency = True
-        self.ev3.screen.clear()
-        self.ev3.screen.draw_text(0, 30, "Emergency")
         closest_zone = self.closestZone()
-        self.ev3.screen.draw_text(0, 50, "Going to")
-        self.ev3.screen.draw_text(0, 70, "Zone: " + str(closest_zone))
-
-        self.moveElbow(top=True, speed=ELBOW_MOTOR_SPEED/4)
-        self.turnBase(self.backupZones[closest_zone], speed=BASE_MOTOR_SPEED/4)
-        self.moveElbow(self.backupZones[closest_zone], speed=ELBOW_MOTOR_SPEED/4)
-        self.openGripper()
-        self.menu = True
+        self.display.showText([(0, "Emergency Stop"), (30, "Release stop,"), (50, "Center: arm to"),
+                               (70, "Zone " + str(closest_zone) + ", then menu")])
+        self.run(self.confirmTask())
+
+        self.emergency = False
+        holding = self.cycle is not None and self.cycle.holding
+        if holding:
+            self.squeeze(self.cycle.size)       # The stop left the jaws holding their angle
+        self.moveElbow(top=True, speed=ELBOW_MOTOR_SPEED/RECOVERY_SLOWDOWN)
+        # Reserves the shared zones on the way, without a grant the arm stays where it is
+        if self.moveArm(base=self.zones[closest_zone], loaded=holding, slow=True) and not holding:
+            self.moveElbow(self.zones[closest_zone], speed=ELBOW_MOTOR_SPEED/RECOVERY_SLOWDOWN)
+            self.openGripper()
         self.inEmergency = False
-        self.afterEmergency = True
+        self.menu = True
 
+    def abandonCycle(self):
+        '''Drops the checkpoint of a cycle an emergency stop cut short, a block it holds is
+        put back at its pickup zone first. For menu items that need the arm.'''
+        if self.cycle is not None and self.cycle.holding:
+            self.pickUpIndex = self.cycle.pickup
+            self.dropOffblock(self.zones, None)
+        self.cycle = None
 
+    def confirmTask(self):
+        '''Waits for a CENTER press while the stop input is not active.'''
+        self.buttons.clear()
+        while self.stop_monitor.active or self.buttons.pressed() != Button.CENTER:
+            yield
 
     def wait(self, time):
-        waited = 0
-        while waited < time:
-            wait(10)
-            waited += 10
-            if Button.CENTER in self.ev3.buttons.pressed():
-                wait(DEBOUNCE_TIME)
-                self.menu = True
-                break
-                while True:
-                    button_press = self.ev3.buttons.pressed()
-                    if Button.DOWN in button_press:
-                        wait(DEBOUNCE_TIME)
-                        self.menu = True
-                    if Button.CENTER in button_press:
-                        wait(DEBOUNCE_TIME)
-                        break
+        self.run(self.waitTask(time))
 
+    def waitTask(self, time):
+        '''Waits between periodic checks, a CENTER press ends it and opens the menu.'''
+        end = self.scheduler.time() + time
+        self.busy += 1
+        try:
+            while self.scheduler.time() < end:
+                if self.paused:
+                    self.paused = False
+                    self.menu = True
+                    return
+                if self.dashboard is not None and self.dashboard.controls or self.emergency:
+                    return          # Handled by the loop right away instead of after the wait
+                yield
+        finally:
+            self.busy -= 1
 
 
     def openGripper(self):
-        print("open1")
-        if self.elbow_motor.angle() > -86:
-            self.runMotor(self.gripper_motor, GRIPPER_MOTOR_SPEED, -86, stop_action=Stop.COAST)        
-        print("open2")
+        start = self.tracer.begin()
+        if self.elbow_motor.angle() > GRIPPER_OPEN_ANGLE:
+            self.runMotor(self.gripper_motor, GRIPPER_MOTOR_SPEED, GRIPPER_OPEN_ANGLE, stop_action=Stop.COAST)        
+        self.tracer.end(OPEN, start)
+
+    def grabAngle(self):
+        '''Gripper angle to open to before grabbing at a pickup zone.'''
+        return GRIPPER_PROBE_WIDE if self.presence_probe else GRIPPER_OPEN_ANGLE
 
     def closeGripper(self):
-        self.stallMotor(self.gripper_motor, GRIPPER_MOTOR_SPEED, 0)
-        print(self.gripper_motor.angle())
-        if (self.gripper_motor.angle() < -5):
-            return True
+        '''Closes the gripper, returns True if it is holding a block.
+
+        With presence_probe the jaws start from grabAngle(), just wider than
+        the biggest block, and only close until narrower than the smallest
+        one, so an empty check is a short move that stops well before fully
+        closed.
+        '''
+        start = self.tracer.begin()
+        if not self.presence_probe:
+            gripped = self.run(self.gripTask(0))
+        else:
+            gripped = self.run(self.gripTask(GRIPPER_PROBE_ANGLE))
+        self.tracer.end(GRIP, start, self.zoneAt(self.base_motor.angle()))
+        return gripped
+
+    def gripTask(self, target):
+        '''Closes the jaws toward target while watching their speed. Returns True as soon as
+        they stop on a block, False once they get within TARGET_TOLERANCE of target.
+
+        stalled() only turns True after the controller has pushed at full
+        actuation for the stall time, the speed drops within a tick or two of
+        the jaws touching the block. Slow readings only count once the jaws
+        have been moving, the start of the move is not a block. A held block
+        is then squeezed with the duty for an unknown size until squeeze()
+        is told its size.
+        '''
+        if self.emergency:
+            return False
+        motor = self.gripper_motor
+        moves = {motor: (GRIPPER_MOTOR_SPEED, target, Stop.HOLD)}
+        self.recorder.motor(self.motor_ids[motor], GRIPPER_MOTOR_SPEED, target, True)
+        motor.stop()
+        motor.run_target(GRIPPER_MOTOR_SPEED, target, then=Stop.HOLD, wait=False)
+        moving = False
+        slow = 0            # Readings in a row below GRIP_STOP_SPEED
+        self.busy += 1
+        try:
+            while motor.angle() < target - TARGET_TOLERANCE:
+                if abs(motor.speed()) >= GRIP_STOP_SPEED:
+                    moving = True
+                    slow = 0
+                elif moving:
+                    slow += 1
+                if slow >= GRIP_READINGS or motor.control.stalled():
+                    self.squeeze("UNKNOWN")
+                    return True
+                yield
+                if self.paused:         # Resuming starts the move again
+                    moving = False
+                    slow = 0
+                if not (yield from self.holdWhilePaused(moves)):
+                    return False
+        finally:
+            self.busy -= 1
         return False
+
+    def squeeze(self, size):
+        '''Presses the jaws on the held block with the duty for its size, hard enough to
+        carry a big block without crushing a small one.'''
+        if self.emergency:
+            return
+        self.gripper_motor.dc(GRIP_DUTY.get(size, GRIP_DUTY["UNKNOWN"]))
     
+    def intercept(self):
+        '''Grabs a block off the belt, returns False if none arrived within wait_time.
+
+        The arm hovers over the pickup zone and starts lowering, then
+        closing, so that the jaws close on the block just as its center
+        passes under them. The leads are running means of the measured
+        descend and grab times. After a miss it tries the next block.
+        '''
+        zone = self.zones[BELT_ZONE]
+        while True:
+            if not self.moveArm(base=zone, elbow=zone.hight + HOVER_OFFSET, gripper=self.grabAngle()):
+                return False
+            start = self.tracer.begin()
+            block = self.run(self.arrivalTask(self.descend_lead + self.close_lead))
+            if block is not None:
+                self.run(self.sleepTask(block[1] - self.close_lead - self.descend_lead))
+            self.tracer.end(WAIT, start, BELT_ZONE)
+            if block is None or self.emergency:
+                return False
+
+            start = self.scheduler.time()
+            self.moveElbow(zone)
+            self.descend_lead += LEAD_WEIGHT * (self.scheduler.time() - start - self.descend_lead)
+            if not self.run(self.sleepTask(block[1] - self.close_lead)):    # The near sensor may have corrected the arrival
+                return False
+            start = self.scheduler.time()
+            if self.closeGripper():
+                self.close_lead += LEAD_WEIGHT * (self.scheduler.time() - start - self.close_lead)
+                return True
+            if self.emergency:
+                return False
+
+    def arrivalTask(self, lead):
+        '''Waits for the next block that reaches the belt pickup at least lead ms from now, at most wait_time.
+        Returns the BeltTracker block, None if none came or an emergency stop ended the wait.'''
+        end = self.scheduler.time() + self.wait_time
+        self.busy += 1
+        try:
+            while not self.emergency:
+                now = self.scheduler.time()
+                block = self.belt.next(now + lead)
+                if block is not None or now >= end:
+                    return block
+                yield
+                if not (yield from self.holdWhilePaused({})):
+                    return None
+        finally:
+            self.busy -= 1
+        return None
+
+    def sleepTask(self, until):
+        '''Waits until the scheduler time until, returns False if an emergency stop ended it.
+        A pause lets the block go by, the jaws then miss it and intercept() takes the next one.'''
+        self.busy += 1
+        try:
+            while self.scheduler.time() < until:
+                if self.emergency:
+                    return False
+                yield min(until - self.scheduler.time(), self.scheduler.tick)
+                if not (yield from self.holdWhilePaused({})):
+                    return False
+        finally:
+            self.busy -= 1
+        return True
+
     def turnBase(self, target, speed=BASE_MOTOR_SPEED):
         '''Turns base motor to target angle if int or to Zone'''
         if isinstance(target, int):
@@ -272,10 +734,183 @@ class Robot:
         if self.elbow_motor.angle() != target_hight:
             self.runMotor(self.elbow_motor, speed, target_hight)
 
+    def coordinate(self, channel, name):
+        '''Starts sharing zones with the robot at the other end of channel.'''
+        self.coordinator = Coordinator(channel, name, self.scheduler.time)
+        self.scheduler.spawn(self.coordinator.task())
+
+    def sharedSlots(self, start, end):
+        '''Slots of the shared zones the arm passes over between two base angles.'''
+        low = min(start, end) - ZONE_WIDTH
+        high = max(start, end) + ZONE_WIDTH
+        return set(SHARED_ZONES.index(index) for index in self.zones.between(low, high) if index in SHARED_ZONES)
+
+    def reserveRoute(self, drop_zone):
+        '''Waits at the pickup zone until the way to drop_zone and back to any pickup zone is reserved.
+
+        Reserving the whole route before leaving means the arm never waits
+        for the other robot while it is over a shared zone itself, as long
+        as the pickup zones are not shared.
+        '''
+        if self.coordinator is None or drop_zone is None:
+            return
+        angles = [self.zones[index].angle for index in self.pickups] + [self.zones[drop_zone].angle]
+        self.route = self.sharedSlots(min(angles), max(angles))
+        self.run(self.coordinator.acquireTask(self.route))
+
+    def leaveRoute(self, toward=None):
+        '''Ends the cycle's reservation. Keeps the slots between the arm and the base angle toward,
+        the next move gives them up as the arm passes them.'''
+        if self.coordinator is not None:
+            self.route = set()
+            angle = self.base_motor.angle()
+            self.coordinator.release(keep=self.sharedSlots(angle, angle if toward is None else toward))
+
+    def pathClearance(self, start, end):
+        '''Elbow angle that clears every zone between two base angles.'''
+        low = min(start, end) - ZONE_WIDTH
+        high = max(start, end) + ZONE_WIDTH
+        hights = [self.zones[index].hight for index in self.zones.between(low, high)]
+        if not hights:
+            return self.top_hight
+        return min(max(hights) + CLEARANCE, self.top_hight)
+
+    def moveArm(self, base=None, elbow=None, gripper=None, loaded=False, slow=False):
+        '''Returns False if an emergency stop, or the other robot not granting the way, cut the move
+        short or kept it from starting.'''
+        if self.emergency:
+            return False
+        return self.run(self.moveArmTask(base, elbow, gripper, loaded, slow)) and not self.emergency
+
+    def moveArmTask(self, base=None, elbow=None, gripper=None, loaded=False, slow=False):
+        '''Moves base, elbow and gripper at the same time and waits for all of them.
+
+        base and elbow take an int or a Zone, gripper an angle to open to. The
+        base only starts turning once the elbow is above every zone on its path
+        and the elbow only goes below that again once the base has arrived.
+        Speeds are gentler when loaded is True, clearances between zones come from the clearance table.
+        slow runs every motor RECOVERY_SLOWDOWN times slower. Returns False if the move was cut short.
+        '''
+        base_target = base.angle if isinstance(base, Zone) else base
+        elbow_target = elbow.hight if isinstance(elbow, Zone) else elbow
+
+        base_angle = self.base_motor.angle()
+        end = self.zones.index(base) if base in self.zones else None
+        profile = limits(loaded)
+
+        rotate = base_target is not None and abs(base_angle - base_target) > TARGET_TOLERANCE
+        if rotate and self.coordinator is not None:
+            self.busy += 1      # CENTER can pause or stop the robot while it waits for the way
+            try:
+                granted = yield from self.coordinator.acquireTask(self.sharedSlots(base_angle, base_target),
+                                                                  lambda: self.emergency)
+            finally:
+                self.busy -= 1
+            if not granted:
+                if not (self.emergency or self.inEmergency):
+                    self.partnerLost()
+                return False
+            if self.emergency:
+                return False
+        if rotate:
+            clearance = self.clearances.lookup(self.zoneAt(base_angle), end)
+            if clearance is None:
+                clearance = self.pathClearance(base_angle, base_target)
+            if elbow_target is None:
+                elbow_target = max(self.elbow_motor.angle(), clearance)
+            elbow_leg = max(elbow_target, clearance)
+        else:
+            elbow_leg = elbow_target
+
+        moves = {}      # motor -> (speed, target, stop_action) it was last sent
+        def start(motor, speed, target, stop_action=Stop.HOLD, acceleration=None):
+            if slow:
+                speed = speed / RECOVERY_SLOWDOWN
+            if acceleration is not None:
+                self.setLimits(motor, speed, acceleration)
+            motor.run_target(speed, target, then=stop_action, wait=False)
+            moves[motor] = (speed, target, stop_action)
+            self.recorder.motor(self.motor_ids[motor], speed, target)
+
+        if gripper is not None:
+            start(self.gripper_motor, GRIPPER_MOTOR_SPEED, gripper, Stop.COAST)
+        if elbow_leg is not None:
+            start(self.elbow_motor, profile.elbow_speed, elbow_leg, acceleration=profile.elbow_acceleration)
+
+        # Traced as lift (up to clearance), rotate and descend (the last elbow leg)
+        leg = LIFT if rotate or elbow_leg is not None and elbow_leg > self.elbow_motor.angle() else DESCEND
+        leg_start = self.tracer.begin() if rotate or elbow_leg is not None else None
+
+        base_started = False
+        self.busy += 1
+        try:
+            while True:
+                if rotate and not base_started and self.elbow_motor.angle() >= clearance - TARGET_TOLERANCE:
+                    start(self.base_motor, profile.base_speed, base_target, acceleration=profile.base_acceleration)
+                    base_started = True
+                    self.tracer.end(leg, leg_start, end)
+                    leg, leg_start = ROTATE, self.tracer.begin()
+
+                if base_started and self.coordinator is not None and self.coordinator.held:
+                    # Let the other robot into the shared zones the arm has left behind
+                    self.coordinator.release(keep=self.route | self.sharedSlots(self.base_motor.angle(), base_target))
+
+                if base_started and elbow_leg != elbow_target and abs(self.base_motor.angle() - base_target) <= TARGET_TOLERANCE:
+                    elbow_leg = elbow_target
+                    start(self.elbow_motor, profile.elbow_speed, elbow_target, acceleration=profile.elbow_acceleration)
+                    self.tracer.end(leg, leg_start, end)
+                    leg, leg_start = DESCEND, self.tracer.begin()
+
+                if ((base_started or not rotate) and elbow_leg == elbow_target and
+                        all(abs(motor.angle() - move[1]) < TARGET_TOLERANCE for motor, move in moves.items())):
+                    self.tracer.end(leg, leg_start, end)
+                    if rotate and self.coordinator is not None:
+                        self.coordinator.release(keep=self.route | self.sharedSlots(base_target, base_target))
+                    break
+
+                yield
+                if not (yield from self.holdWhilePaused(moves)):
+                    return False
+        finally:
+            self.busy -= 1
+        return True
+
     def getColor(self):
+        '''Color and size of the held block, sampled until COLOR_MARGIN readings agree.'''
+        if not self.color_sampling:
+            return self.readColor()
+
+        vote = Vote(COLOR_MARGIN)
+        start = self.scheduler.time()
+        for count in range(COLOR_MAX_SAMPLES):
+            vote.add(self.readColor(refresh=count % REFLECTION_EVERY == 0))
+            if vote.decided() or self.scheduler.time() - start >= COLOR_MAX_TIME:
+                break
+        return vote.winner()
+
+    def readColor(self, refresh=True):
+        '''One color and size reading. refresh=False reuses the last reflection reading.
+
+        Checks the emergency stop between the readings, each sensor mode
+        switch takes about as long as a scheduler tick.
+        '''
+        self.stop_monitor.check()
+        if self.classifier.trained():
+            if refresh or self.last_reflection is None:
+                self.last_reflection = self.elbow_sensor.reflection()
+                self.stop_monitor.check()
+            reading = self.elbow_sensor.rgb() + (self.last_reflection,)
+            label = self.classifier.classify(reading)
+            if label is None:
+                return None, "UNKNOWN"
+            return formatColor(label[0]), label[1]
+
+        # Not calibrated yet, fall back to fixed thresholds
         size = "SMALL"
         color = self.elbow_sensor.color()
+        self.stop_monitor.check()
         brickSize = self.elbow_sensor.reflection()
+        self.stop_monitor.check()
 
         if color == None:
             return color, "UNKNOWN"
@@ -300,35 +935,171 @@ class Robot:
             size = "UNKNOWN"
         return color, size
 
+    def senseWhileLifting(self):
+        '''Lifts the held block past the sensor and returns its color and size.'''
+        if self.emergency:
+            return None, "UNKNOWN"
+        start = self.tracer.begin()
+        result = self.run(self.senseTask())
+        if self.emergency:
+            return None, "UNKNOWN"
+        if result is None:      # Went through the window without a reading, stop at the sensor instead
+            self.moveElbow(sensor=True)
+            result = self.getColor()
+        self.tracer.end(SENSOR, start)
+        return result
+
+    def senseTask(self):
+        '''Reads the sensor while the elbow lifts through the sensor window without stopping.
+
+        Returns the vote over the SENSOR_KEEP readings taken closest to
+        sensor_hight, None if no reading was taken.
+        '''
+        profile = LOADED
+        target = max(self.top_hight, self.sensor_hight + SENSOR_WINDOW + TARGET_TOLERANCE)
+        moves = {self.elbow_motor: (profile.elbow_speed, target, Stop.HOLD)}
+        self.setLimits(self.elbow_motor, profile.elbow_speed, profile.elbow_acceleration)
+        self.elbow_motor.run_target(profile.elbow_speed, target, then=Stop.HOLD, wait=False)
+
+        readings = []       # (degrees from sensor_hight, (color, size))
+        self.busy += 1
+        try:
+            while True:
+                before = self.elbow_motor.angle()
+                if before > self.sensor_hight + SENSOR_WINDOW:
+                    break
+                if before >= self.sensor_hight - SENSOR_WINDOW:
+                    result = self.readColor(refresh=len(readings) % REFLECTION_EVERY == 0)
+                    offset = abs((before + self.elbow_motor.angle()) / 2 - self.sensor_hight)
+                    readings.append((offset, result))
+                    yield 0         # Let the other tasks run but come straight back
+                else:
+                    yield
+                if not (yield from self.holdWhilePaused(moves)):
+                    return None
+        finally:
+            self.busy -= 1
+
+        if not readings:
+            return None
+        readings.sort(key=lambda reading: reading[0])
+        vote = Vote(1)
+        for offset, result in readings[:SENSOR_KEEP]:
+            vote.add(result)
+        return vote.winner()
+
+    def park(self):
+        '''Moves the arm where the idle policy waits for the next block.
+
+        Top lifts clear of every zone. Hover stays over the pickup zone just
+        above its hight with the gripper open, so the next grab only lowers
+        the elbow a few degrees. Sharing zones, Top also turns back to the
+        pickup zone so the arm does not wait over a shared one.
+        '''
+        pickup = self.zones[self.pickUpIndex]
+        self.leaveRoute(pickup.angle)
+        if IDLE_POLICIES[self.idle_policy] == "Hover":
+            self.moveArm(base=pickup, elbow=pickup.hight + HOVER_OFFSET, gripper=self.grabAngle())
+        elif self.coordinator is not None:
+            self.moveArm(base=pickup, elbow=self.top_hight)
+        else:
+            self.moveElbow(top=True)
+        self.leaveRoute()
+
     def dropOffblock(self, zones, color):
-        '''Drops off block at corresponding zone or puts it back down in pick up zone.'''
-        found_zone = False
-        for i, zone in enumerate(zones): 
-            if i != self.pickUpIndex and zone.color == color:            
-                self.turnBase(zone)
-                self.moveElbow(zone)
-                self.openGripper()
-                self.moveElbow(top=True)
-                self.turnBase(zones[self.pickUpIndex])
-                found_zone = True
-                break
-        if not found_zone:
+        '''Drops off block at corresponding zone or puts it back down in pick up zone.
+        Returns the drop off zone's index, None if it was put back. The arm
+        stays at the zone so the next move can start from there.'''
+        start = self.tracer.begin()
+        index = zones.forColor(color)
+        if index is not None:
+            zone = zones[index]
+            self.moveArm(base=zone, elbow=zone, loaded=True)
+            self.openGripper()
+        else:
+            if self.zoneAt(self.base_motor.angle()) != self.pickUpIndex:    # Recovery left the arm elsewhere
+                self.moveArm(base=zones[self.pickUpIndex], loaded=True)
             self.moveElbow(zones[self.pickUpIndex])
             self.openGripper()
             self.moveElbow(top=True)
+        self.tracer.end(DROP, start, index)
+        return index
+
+    def runCycle(self):
+        '''Runs the steps of the current cycle from its checkpoint on.
+
+        Returns once the cycle is done, or keeps the checkpoint and returns
+        early when an emergency stop cut a step short.
+        '''
+        steps = {PICKING: self.pickStep, SENSING: self.senseStep, DROPPING: self.dropStep}
+        while self.cycle.step != DONE:
+            if not steps[self.cycle.step](self.cycle):
+                return
+        self.cycle = None
+
+    def pickStep(self, cycle):
+        '''Moves to the pickup zone and grips. Returns False if it was cut short.'''
+        zone = self.zones[cycle.pickup]
+        if cycle.pickup == BELT_ZONE:
+            present = self.intercept()
+            cycle.start = self.tracer.begin()
+        else:
+            start = self.tracer.begin()
+            if not self.moveArm(base=zone, elbow=zone, gripper=self.grabAngle()):
+                return False
+            self.tracer.end(RETURN, start, cycle.pickup)
+            cycle.start = self.tracer.begin()
+            present = self.closeGripper()
+        if self.emergency:
+            return False
+
+        if present:
+            self.poll.hit(self.scheduler.time())
+            cycle.holding = True
+            cycle.step = SENSING
+        else:
+            self.planner.markEmpty(cycle.pickup)
+            cycle.step = DONE
+        return True
+
+    def senseStep(self, cycle):
+        color, size = self.senseWhileLifting()
+        if self.emergency:
+            return False
+        cycle.color, cycle.size = color, size
+        self.squeeze(size)
+        cycle.drop = self.zones.forColor(color)
+        self.current_color = formatColor(color)
+        self.current_size = size
+        self.runtimeDisplay(color=formatColor(color), size=size)
+        cycle.step = DROPPING
+        return True
+
+    def dropStep(self, cycle):
+        '''Takes the block to its zone, lifting only as high as the path needs. Unknown blocks are put back.'''
+        self.reserveRoute(cycle.drop)
+        drop_zone = self.dropOffblock(self.zones, cycle.color)
+        if self.emergency:
+            return False
+        cycle.holding = False
+        self.tracer.end(CYCLE, cycle.start, drop_zone)
+        self.countCycle(drop_zone, cycle.color, cycle.size)
+        if drop_zone is None:
+            self.planner.markEmpty(cycle.pickup)
+        self.current_color = "No Block"
+        self.current_size = "No Block"
+        self.runtimeDisplay()
+        cycle.step = DONE
+        return True
 
 
     def getSizeColorAt(self, zone):
         color = None
         size = "UNKNOWN"
 
-        self.openGripper()
-        self.moveElbow(top=True)
-        self.turnBase(zone)
-        self.moveElbow(zone)
+        self.moveArm(base=zone, elbow=zone, gripper=GRIPPER_OPEN_ANGLE)
 
         blockPresent = self.closeGripper()
-        print(blockPresent)
 
         self.moveElbow(sensor=True)
         block_color, block_size = self.getColor()
@@ -339,71 +1110,258 @@ class Robot:
         self.moveElbow(top=True)
 
         return block_color, block_size
-    
-    def runtimeDisplay(self, color="No Block", size="No Block"):
-        self.ev3.screen.clear()
-        self.ev3.screen.draw_text(0, 0, "Running")
-        self.ev3.screen.draw_text(0, 20, "Emergency: Hold")
-        self.ev3.screen.draw_text(0, 40, "Pause: Press")
-        self.ev3.screen.draw_text(0, 70, "Color: " + color)
-        self.ev3.screen.draw_text(0, 90, "Size: " + size)
 
-        
+    def calibrateAt(self, zone, label):
+        '''Samples the block at zone at sensor hight and trains label (color name, size) with it.'''
+        self.moveArm(base=zone, elbow=zone, gripper=GRIPPER_OPEN_ANGLE)
+        if not self.closeGripper():
+            self.moveElbow(top=True)
+            return False
 
+        self.moveElbow(sensor=True)
+        self.scheduler.sleep(CALIBRATION_SETTLE)
+        readings = []
+        for _ in range(CALIBRATION_SAMPLES):
+            readings.append(self.elbow_sensor.rgb())
+            self.scheduler.sleep(10)
+        for channel in range(3):
+            self.classifier.addSamples(label, channel, [rgb[channel] for rgb in readings])
+        readings = []
+        for _ in range(CALIBRATION_SAMPLES):
+            readings.append(self.elbow_sensor.reflection())
+            self.scheduler.sleep(10)
+        self.classifier.addSamples(label, 3, readings)
 
-    def menuDraw(self, zones):
-        self.main_menu = ["Start", "Set Drop Off", "Set Time", "Get Color", "Stop"]
-        self.set_dropoff = ["Zone 1: ", "Zone 2: ", "Zone 3: ", "Zone 4: "]
-        self.set_color = ["Red", "Green", "Blue", "Yellow", "PICKUP"]
-        self.set_time = ["Check: ", "Set Time: "]
-        self.get_color = ["Zone 1", "Zone 2", "Zone 3", "Zone 4"]
-        self.set_hight = ["Elevated", "Ground"]
+        self.moveElbow(zone)
+        self.openGripper()
+        self.moveElbow(top=True)
 
-        menu_title = ["Main Menu", "Set Dropoff Color", "", "Set Time", "Get Color At", ""]
-        title_offset = 30
+        self.classifier.train()
+        self.saveCalibration()
+        return True
 
+    def loadCalibration(self):
+        stored = self.config.get("classifier")
+        try:
+            self.classifier.fromDict(stored)
+        except (TypeError, ValueError, KeyError) as error:
+            if stored is not None:
+                print("Stored calibration not usable, calibrate again:", repr(error))
+            self.classifier.reset()
+
+    def saveCalibration(self):
+        self.saveConfig()
+
+    def loadSettings(self):
+        '''Replaces the zones and times with the ones stored in the config file.'''
+        stored = self.config.get("zones")
+        if stored:
+            zones = ZoneMap()
+            for angle, hight, color in stored:
+                zone = Zone(angle)
+                zone.hight = hight
+                zone.color = formatColor(color)
+                zones.append(zone)
+            self.zones = zones
+        pickups = [index for index in self.config.get("pickups", []) if index < len(self.zones)]
+        if pickups:
+            self.pickups = pickups
+            self.pickUpIndex = self.config.get("pickUpIndex", pickups[0])
+        for name in ("wait_time", "min_wait_time", "time_to_start", "idle_policy"):
+            setattr(self, name, self.config.get(name, getattr(self, name)))
+
+    def saveConfig(self, pose=None):
+        '''Stores the settings. pose is the arm position for a warm start, None forces homing.'''
+        self.config.data.update({
+            "zones": [[zone.angle, zone.hight, formatColor(zone.color)] for zone in self.zones],
+            "pickups": self.pickups,
+            "pickUpIndex": self.pickUpIndex,
+            "wait_time": self.wait_time,
+            "min_wait_time": self.min_wait_time,
+            "time_to_start": self.time_to_start,
+            "idle_policy": self.idle_policy,
+            "classifier": self.classifier.toDict() if self.classifier.trained() else None,
+            "pose": pose,
+        })
+        self.config.save()
+    
+    # region Dashboard
+
+    def dashboardTask(self):
+        '''Background task: serves the dashboard every POLL_EVERY ms and publishes mode changes.'''
+        mode = None
+        while True:
+            if self.mode() != mode:
+                mode = self.mode()
+                self.publish("mode", {"mode": mode})
+            self.dashboard.poll()
+            yield POLL_EVERY
+
+    def publish(self, kind, data):
+        if self.dashboard is not None:
+            self.dashboard.publish(kind, data)
+
+    def mode(self):
+        if self.inEmergency or self.emergency:
+            return "emergency"
+        if self.paused:
+            return "paused"
+        if self.menu:
+            return "menu"
+        return "running"
+
+    def dashboardState(self):
+        now = self.scheduler.time()
+        return {
+            "mode": self.mode(),
+            "time": now,
+            "zones": [{"angle": zone.angle, "hight": zone.hight, "color": formatColor(zone.color),
+                       "pickup": index in self.pickups} for index, zone in enumerate(self.zones)],
+            "wait_time": self.wait_time,
+            "min_wait_time": self.min_wait_time,
+            "idle_policy": IDLE_POLICIES[self.idle_policy],
+            "schedule": [{"start": window.start, "length": window.length, "every": window.every}
+                         for window in self.schedule.windows],
+            "in_window": self.schedule.active(now),
+            "block": {"color": self.current_color, "size": self.current_size},
+            "counters": self.counters,
+            "cycle": self.cycle.toDict() if self.cycle is not None else None,
+            "events": self.dashboard.events.next,
+        }
+
+    def applyControls(self, zones):
+        '''Carries out the controls queued on the dashboard, called only where the arm holds no block.
+        Returns True if there were any.'''
+        if self.dashboard is None or not self.dashboard.controls:
+            return False
+        while self.dashboard.controls:
+            control = self.dashboard.controls.pop(0)
+            action = control["action"]
+            if action == "start":
+                applied = self.menu
+                self.start_requested = applied
+            elif action == "pause":
+                applied = not (self.menu or self.paused)
+                if applied:
+                    self.paused = True
+                    self.pauseMenu()
+            elif action == "resume":
+                applied = self.paused
+                if applied:
+                    self.paused = False
+                    self.runtimeDisplay(color=self.current_color, size=self.current_size)
+            else:
+                applied = self.setZoneColor(zones, control.get("zone"), control.get("color"))
+            self.publish("control", {"action": action, "applied": applied})
+        return True
 
-        self.menu_items = [self.main_menu, self.set_dropoff, self.set_color, self.set_time, self.get_color, self.set_hight]
+    def setZoneColor(self, zones, zone, color):
+        '''Same as choosing a color in the menu, zone and color come from the dashboard as text.
+        Zones are numbered from 1 like in the menu.'''
+        try:
+            index = int(zone) - 1
+        except (TypeError, ValueError):
+            return False
+        color = formatColor(color) if isinstance(color, str) else None
+        if color is None or not 0 <= index < len(zones):
+            return False
+        zones[index].color = color
+        if index in self.pickups and len(self.pickups) > 1:
+            self.pickups.remove(index)
+        self.zonesChanged()
+        return True
+
+    def pausedTask(self):
+        '''Holds the cycle at a safe point while the dashboard paused it, it or CENTER resumes.'''
+        while self.paused and not self.emergency:
+            self.applyControls(self.zones)
+            yield
+
+    def countCycle(self, drop_zone, color, size):
+        self.counters["sorted" if drop_zone is not None else "returned"] += 1
+        self.publish("cycle", {"zone": drop_zone, "color": formatColor(color), "size": size,
+                               "time": self.scheduler.time()})
 
-        
-        self.ev3.screen.clear()
+    def runtimeDisplay(self, color="No Block", size="No Block"):
+        '''Shows the running screen, drawn by displayTask while the arm keeps moving.'''
+        self.display_text = (color, size)
+        self.display_dirty = True
+
+    def drawRuntime(self):
+        color, size = self.display_text
+        self.display.showText([
+            (0, "Running"),
+            (20, "E-Stop: Right"),
+            (40, "Pause: Press"),
+            (70, "Color: " + color),
+            (90, "Size: " + size),
+            (110, "Idle: " + IDLE_POLICIES[self.idle_policy]),
+        ])
+
+    def buildMenus(self, zones):
+        '''Creates the menu tables, again only when the number of zones changes.'''
+        self.main_menu = ["Start", "Set Drop Off", "Set Time", "Get Color", "Idle: ", "Trace: ", "Stop"]
+        self.set_dropoff = ["Zone " + str(index + 1) + ": " for index in range(len(zones))]
+        self.set_color = ["Red", "Green", "Blue", "Yellow", "PICKUP"]
+        self.set_time = ["Wait Min: ", "Wait Max: ", "Set Time: ", "Run For: ", "Repeat: ", "Add Window", "Windows: "]
+        self.get_color = ["Zone " + str(index + 1) for index in range(len(zones))] + ["Calibrate"]
+        self.set_hight = ["Elevated", "Ground"]
+        self.calibrate_color = ["Red", "Green", "Blue", "Yellow", "Reset"]
+        self.calibrate_size = ["Big", "Small"]
+
+        self.menu_title = ["Main Menu", "Set Dropoff Color", "", "Set Time", "Get Color At", "", "Calibrate Color", "",
+                           "Idle Position"]
+        self.menu_items = [self.main_menu, self.set_dropoff, self.set_color, self.set_time, self.get_color, self.set_hight,
+                           self.calibrate_color, self.calibrate_size, IDLE_POLICIES]
 
+    def menuDraw(self, zones):
+        '''Shows the current menu, only the lines that changed get redrawn.'''
         title_offset = 30
-        if menu_title[self.menu_selection] != "":
-            self.ev3.screen.draw_text(0,0, menu_title[self.menu_selection])
-        else:
-            self.ev3.screen.draw_text(0,0, self.menu_title_txt)
+        title = self.menu_title[self.menu_selection]
+        lines = {0: ((0, title if title != "" else self.menu_title_txt, False),)}
 
+        time_values = ["%.1fs" % (self.min_wait_time / 1000), "%.1fs" % (self.wait_time / 1000),
+                       str(int(self.time_to_start/60)) + " m",
+                       str(int(self.run_for/60)) + " m" if self.run_for else "-",
+                       str(int(self.repeat_every/60)) + " m" if self.repeat_every else "-",
+                       "", str(len(self.schedule))]
 
+        first = max(0, self.item_selection - MENU_ROWS + 1)     # Scroll so the selection stays on screen
         for index, item in enumerate(self.menu_items[self.menu_selection]):
-            if (self.menu_selection == 1):
-                if index == self.pickUpIndex:
+            if not first <= index < first + MENU_ROWS:
+                continue
+            y = (index - first) * 20 + title_offset
+            if (self.menu_selection == 0) and index == 0 and self.cycle is not None:
+                item = "Resume"         # Carries on the cycle an emergency stop cut short
+            elif (self.menu_selection == 0) and index == 4:
+                item += IDLE_POLICIES[self.idle_policy]
+            elif (self.menu_selection == 0) and index == 5:
+                item += "On" if self.tracer.enabled else "Off"
+            elif (self.menu_selection == 1):
+                if index in self.pickups:
                     item += "Pickup"
                 else:
                     item += formatColor(zones[index].color)
 
-
             if index == self.item_selection:
-                if (self.menu_selection == 3) and index == 0:
-
-                    self.ev3.screen.draw_text(0, index * 20 + 30, item, text_color=Color.WHITE if not self.time_check_selection else Color.BLACK, background_color=Color.BLACK if not self.time_check_selection else Color.WHITE)
-                    whiteBack = str(int(self.wait_time/1000)) + " s"
-                    self.ev3.screen.draw_text(len(item)*12, index * 20 + 30, whiteBack, text_color=Color.BLACK if not self.time_check_selection else Color.WHITE, background_color=Color.WHITE if not self.time_check_selection else Color.BLACK)
-                    #print white back with wite background on same line after item
-                elif (self.menu_selection == 3) and index == 1:
-                    self.ev3.screen.draw_text(0, index * 20 + 30, item, text_color=Color.WHITE if not self.time_check_selection else Color.BLACK, background_color=Color.BLACK if not self.time_check_selection else Color.WHITE)
-                    whiteBack = str(int(self.time_to_start/60)) + " m" # need to change this
-                    self.ev3.screen.draw_text(len(item)*12, index * 20 + 30, whiteBack, text_color=Color.BLACK if not self.time_check_selection else Color.WHITE, background_color=Color.WHITE if not self.time_check_selection else Color.BLACK)
-               
+                if self.menu_selection == 3:
+                    # The value is highlighted instead of the item while it is being changed
+                    lines[y] = ((0, item, not self.time_check_selection),
+                                (len(item)*12, time_values[index], self.time_check_selection))
                 else:
                     # Highlight the selected item by inverting the colors
-                    self.ev3.screen.draw_text(0, index * 20 + title_offset, item, text_color=Color.WHITE, background_color=Color.BLACK)
+                    lines[y] = ((0, item, True),)
             else:
-                self.ev3.screen.draw_text(0, index * 20 + title_offset, item)
-    
+                lines[y] = ((0, item, False),)
 
+        self.display.show(lines)
 
     def menuLoop(self, zones):
+        return self.scheduler.run(self.menuTask(zones))
+
+    def menuTask(self, zones):
+        '''Main menu. Returns True to start sorting and False to stop the program.'''
+        self.display_dirty = False
         self.current_color = "No Block"
         self.current_size = "No Block"
         self.menu_selection = 0
@@ -419,44 +1377,65 @@ class Robot:
 
         needDraw = True     # True if something has changed and screen needs to be redrawn
 
+        self.buttons.clear()    # Presses meant for the running screen
+
         while(True):
-            pressed = self.ev3.buttons.pressed()
+            if self.emergency:
+                self.recover()
+                self.menu_selection = 0
+                self.item_selection = 0
+                needDraw = True
+            button = self.buttons.pressed()
+            if self.applyControls(zones):
+                needDraw = True
+            if self.start_requested:
+                self.start_requested = False
+                return True
             if needDraw:
                 self.menuDraw(zones)
                 needDraw = False
 
-            if Button.DOWN in pressed:
+            if button == Button.DOWN:
                 needDraw = True
 
                 if not self.time_check_selection:
                     self.item_selection = (self.item_selection + 1) % len(self.menu_items[self.menu_selection])
                 else: 
                     if self.item_selection == 0:
-                        self.wait_time -= 1000 if self.wait_time > 999 else 0
+                        self.min_wait_time -= POLL_STEP if self.min_wait_time > POLL_STEP else 0
                     elif self.item_selection == 1:
+                        self.wait_time -= POLL_STEP if self.wait_time > self.min_wait_time else 0
+                    elif self.item_selection == 2:
                         self.time_to_start -= 60 if self.time_to_start > 59 else 0
+                    elif self.item_selection == 3:
+                        self.run_for -= 60 if self.run_for > 59 else 0
+                    elif self.item_selection == 4:
+                        self.repeat_every -= 60 if self.repeat_every > 59 else 0
 
-            elif Button.UP in pressed:
+            elif button == Button.UP:
                 needDraw = True
                 if not self.time_check_selection:
                     self.item_selection = (self.item_selection - 1) % len(self.menu_items[self.menu_selection])
                 else: 
                     if self.item_selection == 0:
-                        self.wait_time += 1000
-                    if self.item_selection == 1:
+                        self.min_wait_time += POLL_STEP if self.min_wait_time < self.wait_time else 0
+                    elif self.item_selection == 1:
+                        self.wait_time += POLL_STEP
+                    elif self.item_selection == 2:
                         self.time_to_start += 60
+                    elif self.item_selection == 3:
+                        self.run_for += 60
+                    elif self.item_selection == 4:
+                        self.repeat_every += 60
 
 
 
         
-            elif Button.CENTER in pressed:
+            elif button == Button.CENTER:
                 needDraw = True
                 # Main menu
                 if self.menu_selection == 0:
                     if self.item_selection == 0:    # Select Start
-                        wait(DEBOUNCE_TIME)
-                        self.backupZones = zones
-                        
                         return True
                     elif self.item_selection == 1:    # Select change color
                         self.menu_selection = 1
@@ -467,6 +1446,14 @@ class Robot:
                     elif self.item_selection == 3:  # Get Color
                         self.menu_selection = 4
                         self.item_selection = 0
+                    elif self.item_selection == 4:  # Idle position
+                        self.menu_selection = 8
+                        self.item_selection = self.idle_policy
+                    elif self.item_selection == 5:  # Tracing, turning it off saves the trace
+                        if self.tracer.enabled:
+                            self.tracer.dump(TRACE_FILE)
+                        self.tracer.clear()
+                        self.tracer.enabled = not self.tracer.enabled
 
 
                     elif self.item_selection == len(self.main_menu) - 1: # Select Last item (Stop)
@@ -483,10 +1470,14 @@ class Robot:
                 
                 # Choose color for zone
                 elif self.menu_selection == 2:
-                    if self.item_selection == 4:
-                        self.pickUpIndex = selected_zone
+                    if self.item_selection == len(self.set_color) - 1:
+                        if selected_zone not in self.pickups:
+                            self.pickups.append(selected_zone)
                     else:
                         zones[selected_zone].color = color_index[self.item_selection]
+                        if selected_zone in self.pickups and len(self.pickups) > 1:
+                            self.pickups.remove(selected_zone)
+                    self.zonesChanged()
                     
                     self.menu_title_txt = "Set Hight: Zone " + str(selected_zone)
                     self.menu_selection = 5
@@ -499,40 +1490,72 @@ class Robot:
 
                 # Set time
                 elif self.menu_selection == 3:
-                    if self.item_selection == 0:
-                        self.time_check_selection = not self.time_check_selection
-                    elif self.item_selection == 1:
+                    if self.item_selection == 5:    # Add a window starting after Set Time
+                        self.schedule.add(self.scheduler.time() + self.time_to_start * 1000,
+                                          self.run_for * 1000 or None, self.repeat_every * 1000 or None)
+                        self.time_to_start = 0
+                    elif self.item_selection == 6:  # Remove all windows
+                        self.schedule.clear()
+                    else:
                         self.time_check_selection = not self.time_check_selection
 
 
+                elif self.menu_selection == 4 and self.item_selection == len(self.get_color) - 1:
+                    self.menu_selection = 6
+                    self.item_selection = 0
+
                 elif self.menu_selection == 4:
-                    wait(DEBOUNCE_TIME)
+                    self.abandonCycle()
                     block_color, block_size = self.getSizeColorAt(zones[self.item_selection])
-                    self.ev3.screen.clear()
-                    self.ev3.screen.draw_text(0,0, self.get_color[self.item_selection])
-                    self.ev3.screen.draw_text(0, 30, "Color: " + formatColor(block_color))
-                    self.ev3.screen.draw_text(0, 20 + 30, "Size: " + block_size)
-
-
-                    self.ev3.screen.draw_text(0, 90, "Enter")
-                    wait(DEBOUNCE_TIME)
-                    while(True):
-                        temp_pressed = self.ev3.buttons.pressed()
-                        if Button.CENTER in temp_pressed:
-                            break
-                        wait(50)
+                    self.display.showText([
+                        (0, self.get_color[self.item_selection]),
+                        (30, "Color: " + formatColor(block_color)),
+                        (50, "Size: " + block_size),
+                        (90, "Enter"),
+                    ])
+                    while self.buttons.pressed() != Button.CENTER:
+                        yield
                     
                 elif self.menu_selection == 5:
                     if self.item_selection == 0:
                         zones[selected_zone].hight = ELEVATED_HEIGHT
                     else:
                         zones[selected_zone].hight = GROUND_HIGHT
+                    self.zonesChanged()
                     self.menu_selection = 1
                     self.item_selection = selected_zone
+
+                # Calibrate: pick color, then size
+                elif self.menu_selection == 6:
+                    if self.item_selection == len(self.calibrate_color) - 1:
+                        self.classifier.reset()
+                        self.saveCalibration()
+                        self.menu_selection = 4
+                        self.item_selection = 0
+                    else:
+                        calibrate_color = color_index[self.item_selection]
+                        self.menu_title_txt = "Size: " + formatColor(calibrate_color)
+                        self.menu_selection = 7
+                        self.item_selection = 0
+
+                elif self.menu_selection == 7:
+                    label = (formatColor(calibrate_color).upper(), "BIG" if self.item_selection == 0 else "SMALL")
+                    self.abandonCycle()
+                    calibrated = self.calibrateAt(zones[self.pickUpIndex], label)
+                    self.display.showText([(0, "Calibrate"), (30, "Saved" if calibrated else "No block"), (90, "Enter")])
+                    while self.buttons.pressed() != Button.CENTER:
+                        yield
+                    self.menu_selection = 6
+                    self.item_selection = 0
+
+                elif self.menu_selection == 8:
+                    self.idle_policy = self.item_selection
+                    self.menu_selection = 0
+                    self.item_selection = 4
                 
 
         
-            elif Button.LEFT in pressed:
+            elif button == Button.LEFT:
                 needDraw = True
                 if self.menu_selection == 1:
                     self.menu_selection = 0
@@ -545,107 +1568,140 @@ class Robot:
                         self.menu_selection = 0
                 elif self.menu_selection == 4:
                     self.menu_selection = 0
+                elif self.menu_selection == 6:
+                    self.menu_selection = 4
+                elif self.menu_selection == 7:
+                    self.menu_selection = 6
+                elif self.menu_selection == 8:
+                    self.menu_selection = 0
 
                 self.item_selection = 0
             else:
-                wait(50)
-        
-            if (Button.LEFT in pressed or 
-                Button.UP in pressed or 
-                Button.DOWN in pressed or 
-                Button.CENTER in pressed):
-                wait(DEBOUNCE_TIME)
-
-
-    def drawTimeToStart(self):
-        self.ev3.screen.clear()
-        self.ev3.screen.draw_text(0, 0, "Waiting to Start")
-        self.ev3.screen.draw_text(0, 50, "Starting in: ")
-        self.ev3.screen.draw_text(10, 70, str(int(self.time_to_start/60)) + " m " + str(int(self.time_to_start%60)) + " s")
-
-    def dispTimeToStart(self):
-        self.drawTimeToStart()
-        ms_to_start = self.time_to_start * 1000
-        while (ms_to_start > 0):
-            wait(6)
-            ms_to_start -= 10
-
-            if ms_to_start % 1000 == 0:
-                self.time_to_start -= 1 
-                self.drawTimeToStart()
-
-            if Button.CENTER in self.ev3.buttons.pressed():
-                    wait(DEBOUNCE_TIME)
-                    ms_to_start = 0
-                    return -1
-        
-        self.time_to_start = 0
-        return 0
-
-            
-
-
-
-def main():
+                yield
+
+
+    def drawTimeToStart(self, seconds):
+        self.display.show({
+            0: ((0, "Waiting to Start", False),),
+            50: ((0, "Starting in: ", False),),
+            70: ((10, str(int(seconds/60)) + " m " + str(int(seconds%60)) + " s", False),),
+        })
+
+    def dispTimeToStart(self, start_at=None):
+        '''Counts down to start_at, time_to_start seconds from now by default.
+        Returns -1 if CENTER cancels it.'''
+        if start_at is None:
+            start_at = self.scheduler.time() + self.time_to_start * 1000
+        return self.scheduler.run(self.countdownTask(start_at))
+
+    def countdownTask(self, start_at):
+        '''Redraws only when the shown second changes and wakes up right at start_at.'''
+        shown = None
+        while True:
+            ms_to_start = start_at - self.scheduler.time()
+            if ms_to_start <= 0:
+                return 0
+
+            seconds = (ms_to_start + 999) // 1000
+            if seconds != shown:
+                shown = seconds
+                self.drawTimeToStart(seconds)
+
+            if self.buttons.pressed() == Button.CENTER:
+                return -1
+            yield min(ms_to_start, self.scheduler.tick)
+
+
+def main(channel=None, name="A"):
+    '''Runs the robot. channel connects it to the other robot in the cell, by default PARTNER is used.'''
     robot = Robot(BASESWITCH_OFFSET)
+    if channel is None and PARTNER is not None:
+        host, port = PARTNER
+        robot.display.showText([(30, "Connecting to"), (50, "other robot")])
+        if host is None:
+            channel = listen(port)
+        else:
+            channel, name = connect(host, port), "B"
+    if channel is not None:
+        robot.coordinate(channel, name)
 
-    zones = []
+    zones = ZoneMap()
     for angle in ZONE_ANGLES:
         zones.append(Zone(angle))
+    for zone, color in zip(zones, ZONE_COLORS):
+        zone.color = color
 
-    zones[2].color = Color.BLUE                 # Random default color
-    zones[3].color = Color.GREEN                # Random default color
+    robot.zones = zones
+    robot.loadSettings()
+    zones = robot.zones
+    robot.zonesChanged()
 
-    robot.moveElbow(top=True)
-    robot.turnBase(zones[robot.pickUpIndex])    # Place arm over pick up zone
+    robot.moveArm(base=zones[robot.pickUpIndex], elbow=robot.top_hight)    # Place arm over pick up zone
 
-    interruptedStart = 0
     while True:
+        if robot.emergency:
+            robot.recover()             # Opens the menu, the cycle keeps its checkpoint
+        if robot.cycle is None:
+            robot.applyControls(zones)      # Between cycles, the arm holds no block
+            if robot.paused:
+                robot.run(robot.pausedTask())
+
         if robot.menu:
-            robot.afterEmergency = False
+            robot.leaveRoute()
             startRobot = robot.menuLoop(zones)
 
             if not startRobot:
+                robot.abandonCycle()
+                if robot.tracer.enabled:
+                    robot.tracer.dump(TRACE_FILE)
+                robot.recorder.stop()
+                robot.shutdown()
                 break
+            robot.saveConfig()
 
             if robot.time_to_start > 0:
                 interruptedStart = robot.dispTimeToStart()
-
-            if interruptedStart == -1:
                 robot.time_to_start = 0
-                robot.menu = True
-                robot.afterEmergency = True
+                if interruptedStart == -1:
+                    continue        # Back to the menu
+
+            robot.runtimeDisplay()
+            robot.menu = False
+            robot.planner.reset()
+            robot.schedule.prune(robot.scheduler.time())     # Windows that ended while in the menu
+
+        if robot.cycle is not None:         # Resume carries on where an emergency stop cut it short
+            robot.runCycle()
+            continue
+
+        now = robot.scheduler.time()
+        if not robot.schedule.active(now):          # Between sort windows
+            start_at = robot.schedule.nextStart(now)
+            robot.park()
+            if start_at is None:
+                robot.schedule.prune(now)
+                robot.menu = True       # Every window is over, Start then sorts without them
+            elif robot.dispTimeToStart(start_at) == -1:
+                robot.menu = True       # CENTER cancelled the wait
             else:
                 robot.runtimeDisplay()
-                robot.menu = False
-
-            robot.moveElbow(top=True)
-            robot.turnBase(zones[robot.pickUpIndex])
-
-        robot.openGripper()
-
-        robot.moveElbow(zones[robot.pickUpIndex])
+                robot.planner.reset()
+            continue
 
-        block_present = robot.closeGripper()
-
-        if block_present:
-            robot.moveElbow(sensor=True)
-            block_color, block_size = robot.getColor()
-            robot.current_color = formatColor(block_color)
-            robot.current_size = block_size
-            robot.runtimeDisplay(color=formatColor(block_color), size=block_size)
-            block_present = False if block_color == None else True
-
-        robot.moveElbow(top=True)
-
-        if block_present:
-            robot.dropOffblock(zones, block_color)
-            robot.current_color = "No Block"
-            robot.current_size = "No Block"
-        
-        if not robot.afterEmergency:
+        pickup = robot.planner.next(zones, robot.pickups, robot.base_motor.angle())
+        if pickup is None:                          # Every pickup zone was empty
+            start = robot.tracer.begin()
+            robot.park()
             robot.runtimeDisplay()
-            robot.wait(robot.wait_time)
+            robot.wait(robot.poll.idle(robot.scheduler.time(), robot.min_wait_time, robot.wait_time))
+            robot.tracer.end(WAIT, start)
+            robot.planner.reset()
+            continue
+
+        robot.pickUpIndex = pickup
+        robot.leaveRoute(zones[pickup].angle)
+        robot.cycle = Cycle(pickup)
+        robot.runCycle()
 
 if __name__== "__main__":
     main() 
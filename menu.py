@@ -5,6 +5,8 @@ from pybricks.ev3devices import Motor, TouchSensor, ColorSensor
 from pybricks.parameters import Port, Stop, Direction, Color, Button
 from pybricks.tools import wait
 
+from display import Display
+
 MAX_BASE_ANGLE = 260        # NOTE: Set the angle to an apropriate value
 
 BASE_MOTOR_SPEED = 60
@@ -36,6 +38,7 @@ class Robot:
 
     def __init__(self):
         self.ev3 = EV3Brick()
+        self.display = Display(self.ev3.screen)
         self.gripper_motor = Motor(Port.A)
         self.elbow_motor = Motor(Port.B, Direction.COUNTERCLOCKWISE, [8, 40])
         self.base_motor = Motor(Port.C, Direction.COUNTERCLOCKWISE, [12, 36])
@@ -46,6 +49,7 @@ class Robot:
         self.base_motor.control.limits(speed=BASE_MOTOR_SPEED, acceleration=120)
         self.dropOffColor = [Color.BLUE, Color.RED, Color.GREEN]
         self.wait_time = 3000            # Time between knowing a block is not present and checking again
+        self.buildMenus()
 
 
     def getSizeColorAt(self, index):
@@ -112,60 +116,58 @@ class Robot:
 
 # region drawCenteredText(txt)
     def drawCenteredText(self, txt):
-        self.ev3.screen.clear()
-        
         height = self.ev3.screen.height
         height = (height // 2) - 10
-        self.ev3.screen.draw_text(10, height, txt)
+        self.display.show({height: ((10, txt, False),)})
 # endregion
 
 
-    def menuDraw(self):
+    def buildMenus(self):
+        '''Creates the menu tables once, menuDraw() only picks from them.'''
         self.main_menu = ["Start", "Set Drop Off", "Set Time", "Get Color", "Stop"]
         self.set_dropoff = ["Zone 1: ", "Zone 2: ", "Zone 3: "]
         self.set_color = ["Red", "Green", "Blue", "Yellow"]
         self.set_time = ["Check: "]
         self.get_color = ["Pick up", "Zone 1", "Zone 2", "Zone 3"]
 
-        menu_title = ["Main Menu", "Set Dropoff Color", "", "Set Time", "Get Color At"]
+        self.menu_title = ["Main Menu", "Set Dropoff Color", "", "Set Time", "Get Color At"]
 
-
-        color_names = {
+        self.color_names = {
             Color.BLUE: "Blue",
             Color.RED: "Red",
             Color.GREEN: "Green",
             Color.YELLOW: "Yellow"
         }
 
-
-
         self.menu_items = [self.main_menu, self.set_dropoff, self.set_color, self.set_time, self.get_color]
 
-        self.ev3.screen.clear()
 
-        if menu_title[self.menu_selection] != "":
-            self.ev3.screen.draw_text(0,0, menu_title[self.menu_selection])
+    def menuDraw(self):
+        '''Shows the current menu, called only after a button changed it.'''
+        if self.menu_title[self.menu_selection] != "":
+            lines = {0: ((0, self.menu_title[self.menu_selection], False),)}
         else:
-            self.ev3.screen.draw_text(0,0, self.menu_title_txt)
+            lines = {0: ((0, self.menu_title_txt, False),)}
 
 
         for index, item in enumerate(self.menu_items[self.menu_selection]):
             if (self.menu_selection == 1):
-                item += color_names[self.dropOffColor[index]]
+                item += self.color_names[self.dropOffColor[index]]
 
 
             if index == self.item_selection:
                 if (self.menu_selection == 3) and index == 0:
-
-                    self.ev3.screen.draw_text(0, index * 20 + 30, item, text_color=Color.WHITE if not self.time_check_selection else Color.BLACK, background_color=Color.BLACK if not self.time_check_selection else Color.WHITE)
+                    # The value is highlighted instead of the item while it is being changed
                     whiteBack = str(int(self.wait_time/1000)) + " s"
-                    self.ev3.screen.draw_text(len(item)*12, index * 20 + 30, whiteBack, text_color=Color.BLACK if not self.time_check_selection else Color.WHITE, background_color=Color.WHITE if not self.time_check_selection else Color.BLACK)
-                    #print white back with wite background on same line after item
+                    lines[index * 20 + 30] = ((0, item, not self.time_check_selection),
+                                              (len(item)*12, whiteBack, self.time_check_selection))
                 else:
                     # Highlight the selected item by inverting the colors
-                    self.ev3.screen.draw_text(0, index * 20 + 30, item, text_color=Color.WHITE, background_color=Color.BLACK)
+                    lines[index * 20 + 30] = ((0, item, True),)
             else:
-                self.ev3.screen.draw_text(0, index * 20 + 30, item)
+                lines[index * 20 + 30] = ((0, item, False),)
+
+        self.display.show(lines)
                 
 
 
@@ -182,11 +184,15 @@ class Robot:
             Color.YELLOW
         ]
 
+        needDraw = True     # True if something has changed and screen needs to be redrawn
         while(True):
             pressed = self.ev3.buttons.pressed()
-            self.menuDraw()
+            if needDraw:
+                self.menuDraw()
+                needDraw = False
 
             if Button.DOWN in pressed:
+                needDraw = True
                 if not self.time_check_selection:
                     self.item_selection = (self.item_selection + 1) % len(self.menu_items[self.menu_selection])
                 else: 
@@ -194,6 +200,7 @@ class Robot:
                 wait(DEBOUNCE_TIME)
 
             elif Button.UP in pressed:
+                needDraw = True
                 if not self.time_check_selection:
                     self.item_selection = (self.item_selection - 1) % len(self.menu_items[self.menu_selection])
                 else: 
@@ -204,6 +211,7 @@ class Robot:
 
         
             elif Button.CENTER in pressed:
+                needDraw = True
                 # Main menu
                 if self.menu_selection == 0:
                     if self.item_selection == 1:    # Select change color
@@ -245,12 +253,8 @@ class Robot:
 
                 elif self.menu_selection == 4:
                     block_color, block_size = self.getSizeColorAt(self.item_selection)
-                    self.ev3.screen.clear()
-                    self.ev3.screen.draw_text(0,0, self.get_color[self.item_selection])
                     temp = self.formatColorSize(block_color, block_size)
-                    self.ev3.screen.draw_text(0, 30, temp)
-
-                    self.ev3.screen.draw_text(0, 90, "Enter")
+                    self.display.showText([(0, self.get_color[self.item_selection]), (30, temp), (90, "Enter")])
                     wait(DEBOUNCE_TIME)
                     while(True):
                         temp_pressed = self.ev3.buttons.pressed()
@@ -264,6 +268,7 @@ class Robot:
 
         
             elif Button.LEFT in pressed:
+                needDraw = True
                 if self.menu_selection == 1:
                     self.menu_selection = 0
                 if self.menu_selection == 2:
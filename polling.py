@@ -0,0 +1,35 @@
+'''Interval between the periodic pickup checks, adapted to how often blocks arrive.
+
+The running mean of the time between found blocks predicts when the next
+one is due, so the robot checks again around then instead of after a fixed
+time. Each check that finds every pickup zone empty makes the next wait
+longer, up to the maximum set in the menu.
+'''
+
+GAP_WEIGHT = 0.3        # Weight of the newest gap between blocks in the running mean
+BACKOFF = 1.5           # Factor the wait grows by after each empty check
+
+
+class PollInterval:
+
+    def __init__(self):
+        self.gap = None         # Mean ms between found blocks
+        self.last_hit = None
+        self.backoff = 0
+
+    def hit(self, now):
+        '''A block was found at time now (ms).'''
+        if self.last_hit is not None:
+            gap = now - self.last_hit
+            self.gap = gap if self.gap is None else self.gap + GAP_WEIGHT * (gap - self.gap)
+        self.last_hit = now
+        self.backoff = 0
+
+    def idle(self, now, minimum, maximum):
+        '''Every pickup zone was empty, returns ms to wait before checking again.'''
+        wait = self.backoff
+        if self.gap is not None:
+            wait = max(wait, self.last_hit + self.gap - now)
+        wait = min(max(wait, minimum), maximum)
+        self.backoff = min(max(self.backoff * BACKOFF, minimum), maximum)
+        return wait
@@ -0,0 +1,156 @@
+'''Binary log of motor commands, color sensor readings and button states.
+
+Each record is a kind byte and the time in ms, followed by the kind's
+fields (FORMATS). Records collect in a preallocated buffer that is
+appended to the log file whenever it fills up and on stop(). The
+sensors and buttons are wrapped so that every read is recorded while
+recording is on, sensor readings with the sensor's port. read()
+returns the records of a log file.
+'''
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+from pybricks.parameters import Button, Color, Port
+
+# Record kinds
+MOTOR = 0       # motor, speed, target, stall
+RGB = 1         # sensor, red, green, blue
+REFLECTION = 2  # sensor, reflection
+COLOR = 3       # sensor, index into COLORS or NO_COLOR
+BUTTONS = 4     # Bit mask of the pressed BUTTON_BITS
+KINDS = ["motor", "rgb", "reflection", "color", "buttons"]
+
+HEADER = "<BI"
+FORMATS = ["<BhhB", "<BBBB", "<BB", "<BB", "<B"]
+
+GRIPPER = 0     # Motor ids
+ELBOW = 1
+BASE = 2
+
+SENSOR_PORTS = [Port.S1, Port.S2, Port.S3, Port.S4]      # Sensor ids are indexes into this
+
+COLORS = [Color.BLACK, Color.BLUE, Color.GREEN, Color.YELLOW, Color.RED, Color.WHITE, Color.BROWN]
+NO_COLOR = 255
+BUTTON_BITS = [Button.LEFT, Button.RIGHT, Button.UP, Button.DOWN, Button.CENTER]
+
+SIZE = 2048     # Bytes buffered before they are written out
+
+
+class Recorder:
+
+    def __init__(self, clock, path, size=SIZE):
+        self.clock = clock          # Returns the time in ms
+        self.path = path
+        self.enabled = False
+        self.buffer = bytearray(size)
+        self.used = 0
+        self.header_size = struct.calcsize(HEADER)
+        self.sizes = [struct.calcsize(fmt) for fmt in FORMATS]
+
+    def start(self):
+        '''Starts a new log file.'''
+        with open(self.path, "wb"):
+            pass
+        self.used = 0
+        self.enabled = True
+
+    def stop(self):
+        self.flush()
+        self.enabled = False
+
+    def flush(self):
+        if self.used:
+            with open(self.path, "ab") as f:
+                f.write(self.buffer[:self.used])
+            self.used = 0
+
+    def add(self, kind, *fields):
+        size = self.header_size + self.sizes[kind]
+        if self.used + size > len(self.buffer):
+            self.flush()
+        struct.pack_into(HEADER, self.buffer, self.used, kind, int(self.clock()) & 0xFFFFFFFF)
+        struct.pack_into(FORMATS[kind], self.buffer, self.used + self.header_size, *fields)
+        self.used += size
+
+    def motor(self, motor, speed, target, stall=False):
+        if self.enabled:
+            self.add(MOTOR, motor, int(speed), int(target), 1 if stall else 0)
+
+
+class RecordedSensor:
+    '''Color sensor that records what it reads, along with the port it is on.'''
+
+    def __init__(self, sensor, recorder, port):
+        self.sensor = sensor
+        self.recorder = recorder
+        self.id = SENSOR_PORTS.index(port)
+
+    def rgb(self):
+        values = self.sensor.rgb()
+        if self.recorder.enabled:
+            self.recorder.add(RGB, self.id, *values)
+        return values
+
+    def reflection(self):
+        value = self.sensor.reflection()
+        if self.recorder.enabled:
+            self.recorder.add(REFLECTION, self.id, value)
+        return value
+
+    def color(self):
+        color = self.sensor.color()
+        if self.recorder.enabled:
+            self.recorder.add(COLOR, self.id, COLORS.index(color) if color in COLORS else NO_COLOR)
+        return color
+
+    def ambient(self):
+        return self.sensor.ambient()
+
+
+class RecordedButtons:
+    '''Brick buttons that record the pressed buttons whenever they change.'''
+
+    def __init__(self, buttons, recorder):
+        self.buttons = buttons
+        self.recorder = recorder
+        self.last = 0
+
+    def pressed(self):
+        pressed = self.buttons.pressed()
+        if self.recorder.enabled:
+            mask = buttonMask(pressed)
+            if mask != self.last:
+                self.recorder.add(BUTTONS, mask)
+                self.last = mask
+        return pressed
+
+
+def buttonMask(pressed):
+    mask = 0
+    for bit, button in enumerate(BUTTON_BITS):
+        if button in pressed:
+            mask |= 1 << bit
+    return mask
+
+
+def maskButtons(mask):
+    return [button for bit, button in enumerate(BUTTON_BITS) if mask & 1 << bit]
+
+
+def read(path):
+    '''(kind, time, fields) of every record in a log file.'''
+    with open(path, "rb") as f:
+        data = f.read()
+    header_size = struct.calcsize(HEADER)
+    records = []
+    offset = 0
+    while offset + header_size <= len(data):
+        kind, time = struct.unpack_from(HEADER, data, offset)
+        offset += header_size
+        fields = struct.unpack_from(FORMATS[kind], data, offset)
+        offset += struct.calcsize(FORMATS[kind])
+        records.append((kind, time, fields))
+    return records
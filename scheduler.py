@@ -0,0 +1,115 @@
+'''Cooperative scheduler driving the robot's motion, button and display tasks.
+
+Tasks are generators. Inside a task:
+    yield           run again on the next tick
+    yield 300       sleep for 300 ms
+    yield task      wait until another Task has finished, get its result
+Use ``yield from`` to call another generator as a subroutine.
+
+A monitor, if set, is called before every task is resumed and before the
+scheduler sleeps, e.g. to watch the emergency stop.
+'''
+
+from pybricks.tools import StopWatch, wait
+
+TICK = 5            # ms between passes over the tasks
+
+
+class Task:
+    def __init__(self, generator):
+        self.generator = generator
+        self.wake_at = 0
+        self.waiting_for = None
+        self.active = False         # True while the generator is executing
+        self.done = False
+        self.result = None
+
+    def cancel(self):
+        self.done = True
+
+
+class Scheduler:
+
+    def __init__(self, tick=TICK):
+        self.tick = tick
+        self.watch = StopWatch()
+        self.tasks = []
+        self.monitor = None         # Called between tasks, has to be quick
+
+    def time(self):
+        return self.watch.time()
+
+    def spawn(self, generator):
+        '''Adds a task, it first runs on the next step.'''
+        task = Task(generator)
+        task.wake_at = self.time()
+        self.tasks.append(task)
+        return task
+
+    def run(self, generator):
+        '''Drives every task until ``generator`` has finished and returns its result.
+
+        Blocking helpers call this, so it can be nested; tasks further up the
+        call stack are skipped until their helper returns.
+        '''
+        task = self.spawn(generator)
+        while True:
+            delay = self.step()
+            if task.done:
+                return task.result
+            if delay > 0:
+                if self.monitor is not None:
+                    self.monitor()
+                wait(delay)
+
+    def sleep(self, ms):
+        '''Like wait(), but the tasks keep running meanwhile.'''
+        def sleeper():
+            yield ms
+        self.run(sleeper())
+
+    def step(self):
+        '''Resumes every task that is due. Returns ms until one is due again.'''
+        now = self.time()
+        for task in self.tasks[:]:
+            if task.done or task.active:
+                continue
+            if task.waiting_for is not None:
+                if not task.waiting_for.done:
+                    continue
+                value = task.waiting_for.result
+                task.waiting_for = None
+            elif task.wake_at > now:
+                continue
+            else:
+                value = None
+            if self.monitor is not None:
+                self.monitor()
+            self._resume(task, value)
+        self.tasks = [task for task in self.tasks if not task.done]
+
+        now = self.time()
+        delay = self.tick
+        for task in self.tasks:
+            if not task.active and task.waiting_for is None:
+                delay = min(delay, task.wake_at - now)
+        return max(delay, 0)
+
+    def _resume(self, task, value):
+        task.active = True
+        try:
+            request = task.generator.send(value)
+        except StopIteration as stop:
+            task.done = True
+            task.result = stop.args[0] if stop.args else None
+            return
+        finally:
+            task.active = False
+
+        now = self.time()
+        if request is None:
+            task.wake_at = now + self.tick
+        elif isinstance(request, Task):
+            task.waiting_for = request
+        else:
+            task.wake_at = now + request
@@ -0,0 +1,30 @@
+'''Simulated pybricks backend for running the sorter off the brick.
+
+``install()`` builds a simulation from a scenario and puts a ``pybricks``
+shim on ``sys.path``, so ``main.py`` imports and runs unchanged on a
+plain Python 3 install. Time is virtual: ``wait()`` and every hardware
+access move the clock instead of sleeping.
+'''
+
+import os
+import sys
+
+from sim import devices
+from sim.clock import SimulationEnd, VirtualClock
+from sim.world import DEFAULT_SCENARIO, Simulation, loadScenario
+
+SHIM_PATH = os.path.join(os.path.dirname(__file__), "shim")
+
+
+def install(scenario=None):
+    '''Creates the simulation the pybricks shim devices attach to.'''
+    if scenario is None:
+        scenario = loadScenario(DEFAULT_SCENARIO)
+    elif isinstance(scenario, str):
+        scenario = loadScenario(scenario)
+
+    simulation = Simulation(scenario)
+    devices.current = simulation
+    if SHIM_PATH not in sys.path:
+        sys.path.insert(0, SHIM_PATH)
+    return simulation
@@ -0,0 +1,166 @@
+'''Runs main.py against the simulator and reports sort cycle statistics.
+
+    python3 -m sim.bench [scenario.json] [--items N] [--verbose] [--trace] [--record FILE]
+    python3 -m sim.bench sim/scenarios/belt.json --belt-speeds 50,100,150
+'''
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import tempfile
+import time
+
+import sim
+
+US16_LIMIT = 5000           # ms, pick up and drop off within 5 seconds
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))]
+
+
+def run(scenario=None, items=None, verbose=False, trace=False, record=None, setup=None):
+    '''Runs main.main() until the scenario ends and returns the simulation.
+    With trace the robot's Tracer is kept as simulation.tracer, record is
+    the file the robot logs to. setup(main, simulation) is called before
+    the robot starts.'''
+    if scenario is None or isinstance(scenario, str):
+        scenario = sim.loadScenario(scenario or sim.DEFAULT_SCENARIO)
+    if items is not None:
+        scenario.setdefault("feed", {})["count"] = items
+
+    simulation = sim.install(scenario)
+    main = importlib.import_module("main")
+    main.CONFIG_FILE = os.path.join(tempfile.mkdtemp(), "config.json")    # Every run starts cold
+    for name, value in scenario.get("robot", {}).items():     # Overrides main.py constants
+        setattr(main, name, value)
+    if trace:
+        main.TRACE = True
+        tracer_class = main.Tracer
+
+        def keepTracer(*args, **kwargs):
+            simulation.tracer = tracer_class(*args, **kwargs)
+            return simulation.tracer
+        main.Tracer = keepTracer
+    if record:
+        main.RECORD = True
+        main.RECORD_FILE = record
+        recorder_class = main.Recorder
+
+        def keepRecorder(*args, **kwargs):
+            simulation.recorder = recorder_class(*args, **kwargs)
+            return simulation.recorder
+        main.Recorder = keepRecorder
+    if setup is not None:
+        setup(main, simulation)
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.time()
+    with output:
+        try:
+            main.main()
+        except sim.SimulationEnd:
+            pass
+    if record:
+        simulation.recorder.flush()
+    simulation.wall_time = time.time() - start
+    return simulation
+
+
+def _stats(name, values):
+    if not values:
+        return name + "n/a"
+    mean = sum(values) / len(values)
+    return (name + "mean %.2f s  p95 %.2f s  max %.2f s"
+            % (mean / 1000, percentile(values, 95) / 1000, max(values) / 1000))
+
+
+def report(simulation):
+    sorted_blocks = [d for d in simulation.deliveries if not d.returned]
+    times = [d.time for d in sorted_blocks]
+    cycles = [b - a for a, b in zip(times, times[1:])]
+    pick_to_drop = [d.time - d.block.gripped for d in sorted_blocks]
+    arrival_to_grip = [d.block.gripped - d.block.arrived for d in sorted_blocks]
+    misrouted = [d for d in sorted_blocks
+                 if simulation.zones[d.zone_index].color not in (None, d.block.color)]
+    virtual = simulation.clock.now / 1000.0
+
+    lines = [
+        "items sorted:   " + str(len(sorted_blocks)),
+        "virtual time:   %.1f s (%.1f items/min)" % (virtual, len(sorted_blocks) * 60 / max(virtual, 1e-9)),
+        "wall time:      %.2f s (%.0fx real time, %.0f cycles/min)"
+        % (simulation.wall_time, virtual / max(simulation.wall_time, 1e-9),
+           len(sorted_blocks) * 60 / max(simulation.wall_time, 1e-9)),
+        _stats("cycle time:     ", cycles),
+        _stats("pick to drop:   ", pick_to_drop),
+        _stats("wait for grip:  ", arrival_to_grip),
+        "US16 (< 5 s):   %.1f%% of cycles"
+        % (100.0 * len([c for c in cycles if c < US16_LIMIT]) / max(len(cycles), 1)),
+        "misrouted:      " + str(len(misrouted)),
+        "returned:       " + str(len(simulation.deliveries) - len(sorted_blocks)),
+        "dropped:        " + str(simulation.dropped),
+    ]
+    if simulation.belt is not None:
+        lines.append("belt:           %d of %d blocks grabbed (%.0f%%), %d of %d grabs hit"
+                     % (simulation.belt_grips, simulation.produced, 100.0 * simulation.belt_grips / max(simulation.produced, 1),
+                        simulation.belt_grips, simulation.belt_attempts))
+    return "\n".join(lines)
+
+
+def beltReport(scenario, speeds, items=None):
+    '''Runs a belt scenario at each speed (mm/s), one line per speed.'''
+    lines = ["speed mm/s  grabbed   hit  items/min"]
+    for speed in speeds:
+        scenario = sim.loadScenario(scenario) if isinstance(scenario, str) else scenario
+        scenario = json.loads(json.dumps(scenario))       # Every run starts from the file's scenario
+        scenario["belt"]["speed"] = speed
+        simulation = run(scenario, items)
+        sorted_blocks = len([d for d in simulation.deliveries if not d.returned])
+        belt_minutes = simulation.produced * scenario["belt"]["interval"] / 60000.0
+        lines.append("%10d %7.0f%% %4.0f%% %10.1f"
+                     % (speed, 100.0 * simulation.belt_grips / max(simulation.produced, 1),
+                        100.0 * simulation.belt_grips / max(simulation.belt_attempts, 1),
+                        sorted_blocks / belt_minutes))
+    return "\n".join(lines)
+
+
+def traceReport(tracer):
+    '''Mean and longest time of every traced phase per zone.'''
+    from tracer import PHASES
+    lines = ["phase     zone      n   mean ms    max ms"]
+    summary = tracer.summary()
+    for phase, zone in sorted(summary, key=lambda key: (key[0], -1 if key[1] is None else key[1])):
+        count, total, longest = summary[(phase, zone)]
+        lines.append("%-9s %4s %6d %9.0f %9.0f"
+                     % (PHASES[phase], "-" if zone is None else zone, count, total / count, longest))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sort loop on simulated hardware.")
+    parser.add_argument("scenario", nargs="?", default=sim.DEFAULT_SCENARIO)
+    parser.add_argument("--items", type=int, default=None, help="number of blocks to sort")
+    parser.add_argument("--verbose", action="store_true", help="show the robot's print output")
+    parser.add_argument("--trace", action="store_true", help="print the time spent in each phase")
+    parser.add_argument("--record", metavar="FILE", help="log the run for sim.replay")
+    parser.add_argument("--belt-speeds", metavar="MM_S,...", help="run a belt scenario at each speed")
+    args = parser.parse_args()
+
+    if args.belt_speeds:
+        print(beltReport(args.scenario, [int(speed) for speed in args.belt_speeds.split(",")], args.items))
+        return
+
+    simulation = run(args.scenario, args.items, args.verbose, args.trace, args.record)
+    print(report(simulation))
+    if args.trace:
+        print(traceReport(simulation.tracer))
+
+
+if __name__ == "__main__":
+    main()
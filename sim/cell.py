@@ -0,0 +1,182 @@
+'''Runs two robots in one work cell and reports throughput and arm collisions.
+
+    python3 -m sim.cell [cell.json] [--alone]
+
+Each robot runs main.main() in its own thread with its own simulated
+hardware; the threads take turns on one virtual clock, so only one of
+them executes at a time. The robots talk over an in-process channel.
+The cell file lists each robot's scenario with keys to override in it,
+the zones both arms reach (pairs of zone indexes, one per robot) and
+main.py overrides. An arm is
+over a shared zone while its base is within ZONE_WIDTH of it; both arms
+over the same one at once counts as a collision. --alone runs both
+robots without coordination, to compare with.
+'''
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+import sim
+from sim import devices
+from sim.clock import SimulationEnd, VirtualClock
+from sim.world import Simulation
+
+DEFAULT_CELL = os.path.join(os.path.dirname(__file__), "scenarios", "two_robots.json")
+CHECK_EVERY = 5             # ms between collision checks
+
+
+class LockstepClock(VirtualClock):
+    '''Virtual clock shared by several threads, only one of which runs at a time.
+
+    A thread that advances the clock hands over to the thread whose wait
+    ends first, and only continues once its own wait ends first.
+    '''
+
+    def __init__(self):
+        VirtualClock.__init__(self)
+        self.condition = threading.Condition()
+        self.waiting = {}           # thread -> clock time its wait ends
+        self.running = None
+
+    def advance(self, ms):
+        me = threading.current_thread()
+        with self.condition:
+            self.waiting[me] = self.now + max(ms, 0)
+            if self.running is me:
+                self.handOver()
+            while self.running is not me and not self.finished:
+                self.condition.wait()
+            target = self.waiting.pop(me)
+            VirtualClock.advance(self, target - self.now)
+
+    def handOver(self):
+        self.running = min(self.waiting, key=lambda thread: (self.waiting[thread], thread.name)) if self.waiting else None
+        self.condition.notify_all()
+
+    def start(self, count):
+        '''Lets the first thread run once count threads wait.'''
+        with self.condition:
+            while len(self.waiting) < count:
+                self.condition.wait(0.01)
+            self.handOver()
+
+    def leave(self):
+        '''Called by a thread that stops using the clock.'''
+        with self.condition:
+            self.waiting.pop(threading.current_thread(), None)
+            if self.running is threading.current_thread():
+                self.handOver()
+
+
+class Collisions:
+    '''Checks every CHECK_EVERY ms whether both arms are over the same shared zone.'''
+
+    def __init__(self, clock, simulations, shared, width):
+        self.clock = clock
+        self.simulations = simulations
+        self.shared = shared        # [index in the first robot's zones, index in the second's]
+        self.width = width
+        self.time = 0               # ms both arms spent over the same zone
+        self.count = 0
+        self.touching = False
+        clock.schedule(CHECK_EVERY, self.check)
+
+    def over(self, simulation, index):
+        return abs(simulation.angleOf("base") - simulation.zones[index].angle) <= self.width
+
+    def check(self):
+        touching = any(all(self.over(simulation, index) for simulation, index in zip(self.simulations, pair))
+                       for pair in self.shared)
+        if touching:
+            self.time += CHECK_EVERY
+            if not self.touching:
+                self.count += 1
+        self.touching = touching
+        self.clock.schedule(self.clock.now + CHECK_EVERY, self.check)
+
+
+def run(cell=None, alone=False, verbose=False):
+    '''Runs both robots until the cell's duration is over. Returns their simulations and the Collisions.'''
+    if cell is None or isinstance(cell, str):
+        with open(cell or DEFAULT_CELL) as f:
+            cell = json.load(f)
+
+    clock = LockstepClock()
+    simulations = []
+    for entry in cell["robots"]:
+        scenario = sim.loadScenario(os.path.join(os.path.dirname(DEFAULT_CELL), entry["scenario"]))
+        scenario.update(entry.get("override", {}))
+        scenario["duration"] = cell["duration"]
+        simulations.append(Simulation(scenario, clock))
+    sim.install(simulations[0].scenario)       # Puts the pybricks shim on sys.path
+    devices.current = None
+
+    main = importlib.import_module("main")
+    main.CONFIG_FILE = os.path.join(tempfile.mkdtemp(), "config.json")
+    for name, value in cell.get("robot", {}).items():
+        setattr(main, name, value)
+    main.SHARED_ZONES = [pair[0] for pair in cell["shared"]]
+    collisions = Collisions(clock, simulations, cell["shared"], main.ZONE_WIDTH)
+
+    channels = [None, None]
+    if not alone:
+        from coordination import localPair
+        channels = localPair()
+
+    def robot(simulation, channel, name):
+        devices.local.simulation = simulation
+        try:
+            clock.advance(0)
+            main.main(channel, name)
+        except SimulationEnd:
+            pass
+        finally:
+            clock.leave()
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.time()
+    with output:
+        threads = [threading.Thread(target=robot, args=(simulation, channel, name), name=name)
+                   for simulation, channel, name in zip(simulations, channels, "AB")]
+        for thread in threads:
+            thread.start()
+        clock.start(len(threads))
+        for thread in threads:
+            thread.join()
+    wall_time = time.time() - start
+    return simulations, collisions, wall_time
+
+
+def report(simulations, collisions, wall_time):
+    minutes = simulations[0].clock.now / 60000.0
+    lines = []
+    total = 0
+    for name, simulation in zip("AB", simulations):
+        sorted_blocks = len([d for d in simulation.deliveries if not d.returned])
+        total += sorted_blocks
+        lines.append("robot %s:        %d items (%.1f items/min)" % (name, sorted_blocks, sorted_blocks / minutes))
+    lines.append("cell:           %d items (%.1f items/min)" % (total, total / minutes))
+    lines.append("collisions:     %d (%.1f s with both arms over one zone)" % (collisions.count, collisions.time / 1000.0))
+    lines.append("wall time:      %.2f s" % wall_time)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run two robots sharing zones on simulated hardware.")
+    parser.add_argument("cell", nargs="?", default=DEFAULT_CELL)
+    parser.add_argument("--alone", action="store_true", help="run the robots without coordination")
+    parser.add_argument("--verbose", action="store_true", help="show the robots' print output")
+    args = parser.parse_args()
+
+    print(report(*run(args.cell, args.alone, args.verbose)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+'''Virtual millisecond clock that drives the simulated hardware.'''
+
+import heapq
+
+
+class SimulationEnd(Exception):
+    '''Raised out of the robot code once the scenario is finished.'''
+
+
+class VirtualClock:
+    '''Time only moves when the robot code waits or talks to a device.
+
+    Events (block arrivals, the gripper reaching a block, ...) are queued
+    with ``schedule`` and fire in order while the clock is advanced.
+    '''
+
+    def __init__(self):
+        self.now = 0.0
+        self.limit = None           # Virtual ms after which the run ends
+        self.finished = False
+        self._events = []
+        self._seq = 0
+
+    def time(self):
+        return self.now
+
+    def schedule(self, at, callback):
+        '''Runs callback once the clock reaches ``at``. Returns a handle for cancel().'''
+        self._seq += 1
+        entry = [max(at, self.now), self._seq, callback]
+        heapq.heappush(self._events, entry)
+        return entry
+
+    def cancel(self, entry):
+        if entry is not None:
+            entry[2] = None
+
+    def advance(self, ms):
+        if self.finished:
+            raise SimulationEnd()
+        target = self.now + max(ms, 0)
+        while self._events and self._events[0][0] <= target:
+            at, _, callback = heapq.heappop(self._events)
+            if callback is None:
+                continue
+            self.now = max(self.now, at)
+            callback()
+        self.now = target
+
+        if self.limit is not None and self.now >= self.limit:
+            self.finished = True
+        if self.finished:
+            raise SimulationEnd()
@@ -0,0 +1,221 @@
+'''Serves the dashboard of a simulated robot.
+
+    python3 -m sim.dashboard [scenario.json] [--port 8080] [--speed 1]
+    python3 -m sim.dashboard [scenario.json] --check [--items N]
+
+The robot sorts the scenario with DASHBOARD_PORT set, paced to speed
+times real time so http://localhost:PORT/ can be watched and used. --check
+drives the dashboard from a client thread instead: it follows the event
+stream, reads the state, pauses and resumes the robot and changes a
+zone's color. It then runs the scenario flat out with an event stream
+open and compares the cycle times with a run without the dashboard, along
+with the wall time the dashboard's polls took.
+'''
+
+import argparse
+import json
+import socket
+import threading
+import time
+
+import sim
+from sim import bench
+
+DEFAULT_PORT = 8080
+CHECK_SPEED = 20            # Times real time the --check run goes at
+TIMEOUT = 10.0              # s the check waits for the robot to react
+
+
+def pace(clock, speed):
+    '''Makes the virtual clock go at speed times real time.'''
+    advance = clock.advance
+    start = time.time()
+
+    def paced(ms):
+        advance(ms)
+        delay = clock.now / 1000.0 / speed - (time.time() - start)
+        if delay > 0:
+            time.sleep(delay)
+    clock.advance = paced
+
+
+def run(scenario, items, port, speed=None, stream=False):
+    '''Runs the scenario with the dashboard on, optionally paced and with an
+    EventReader following it as simulation.reader. The wall time the
+    dashboard's polls took is kept as simulation.poll_time.'''
+    def setup(main, simulation):
+        dashboard_class = main.Dashboard
+        modules.append((main, dashboard_class))
+        main.DASHBOARD_PORT = port
+        simulation.poll_time = 0.0
+        simulation.polls = 0
+        simulation.reader = None
+
+        def timedDashboard(*args, **kwargs):
+            simulation.dashboard = dashboard_class(*args, **kwargs)
+            poll = simulation.dashboard.poll
+
+            def timedPoll():
+                start = time.perf_counter()
+                poll()
+                simulation.poll_time += time.perf_counter() - start
+                simulation.polls += 1
+            simulation.dashboard.poll = timedPoll
+            if stream:
+                simulation.reader = EventReader(port)
+                simulation.reader.start()
+            return simulation.dashboard
+        main.Dashboard = timedDashboard
+        if speed is not None:
+            pace(simulation.clock, speed)
+
+    modules = []
+    try:
+        simulation = bench.run(scenario, items, setup=setup)
+    finally:
+        for main, dashboard_class in modules:       # main.py stays imported for the next run
+            main.DASHBOARD_PORT = None
+            main.Dashboard = dashboard_class
+    simulation.dashboard.close()
+    return simulation
+
+
+def request(port, method, path):
+    '''Sends one request, returns the status code and the body.'''
+    connection = socket.create_connection(("localhost", port), timeout=TIMEOUT)
+    connection.sendall(("%s %s HTTP/1.0\r\nContent-Length: 0\r\n\r\n" % (method, path)).encode())
+    data = b""
+    while True:
+        chunk = connection.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    connection.close()
+    head, body = data.split(b"\r\n\r\n", 1)
+    return int(head.split(b" ")[1]), body.decode()
+
+
+def connect(port):
+    '''Waits until the dashboard accepts connections.'''
+    deadline = time.time() + TIMEOUT
+    while True:
+        try:
+            return request(port, "GET", "/state")
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+class EventReader(threading.Thread):
+    '''Follows /events and keeps every event received.'''
+
+    def __init__(self, port):
+        threading.Thread.__init__(self, daemon=True)
+        self.port = port
+        self.events = []
+
+    def run(self):
+        connection = socket.create_connection(("localhost", self.port), timeout=TIMEOUT)
+        connection.sendall(b"GET /events HTTP/1.0\r\n\r\n")
+        buffer = b""
+        try:
+            while True:
+                chunk = connection.recv(4096)
+                if not chunk:
+                    break
+                buffer += chunk
+                while b"\n\n" in buffer:
+                    message, buffer = buffer.split(b"\n\n", 1)
+                    for line in message.decode().split("\n"):
+                        if line.startswith("data: "):
+                            self.events.append(json.loads(line[len("data: "):]))
+        except OSError:
+            pass
+
+    def wait(self, test):
+        '''Waits for an event test() accepts, returns it or None after TIMEOUT.'''
+        deadline = time.time() + TIMEOUT
+        while time.time() < deadline:
+            for event in self.events:
+                if test(event):
+                    return event
+            time.sleep(0.02)
+        return None
+
+
+def check(port, results):
+    '''Client side of --check, appends (step, passed, detail) to results.'''
+    status, body = connect(port)
+    reader = EventReader(port)
+    reader.start()
+    results.append(("state", status == 200 and "zones" in json.loads(body), body[:60] + "..."))
+
+    reader.wait(lambda event: event["kind"] == "mode" and event["data"]["mode"] == "running")
+    for action, mode in (("pause", "paused"), ("resume", "running")):
+        sent = time.time()
+        request(port, "POST", "/control?action=" + action)
+        event = reader.wait(lambda event: event["kind"] == "mode" and event["data"]["mode"] == mode)
+        results.append((action, event is not None, "%.0f ms real time" % ((time.time() - sent) * 1000)))
+
+    original = json.loads(request(port, "GET", "/state")[1])["zones"][3]["color"]
+    request(port, "POST", "/control?action=color&zone=4&color=Yellow")    # Zone 4 in the menu
+    applied = reader.wait(lambda event: event["kind"] == "control" and event["data"]["action"] == "color")
+    state = json.loads(request(port, "GET", "/state")[1])
+    results.append(("color", applied is not None and state["zones"][3]["color"] == "Yellow", state["zones"][3]))
+    request(port, "POST", "/control?action=color&zone=4&color=" + original)     # Or its blocks never get sorted
+    request(port, "POST", "/control?action=color&zone=0&color=Yellow")
+    rejected = reader.wait(lambda event: event["kind"] == "control" and event["data"]["action"] == "color"
+                           and not event["data"]["applied"])
+    results.append(("zone 0", rejected is not None, "rejected, zones count from 1"))
+    results.append(("bad action", request(port, "POST", "/control?action=jump")[0] == 400, ""))
+
+    reader.wait(lambda event: event["kind"] == "cycle")
+    results.append(("events", bool(reader.events), "%d received" % len(reader.events)))
+
+
+def overhead(scenario, items, port):
+    '''Runs the scenario without and with the dashboard (one event stream open). Returns report lines.'''
+    plain = bench.run(scenario, items)
+    served = run(scenario, items, port, stream=True)
+
+    lines = []
+    for name, simulation in (("without", plain), ("with", served)):
+        times = [d.time for d in simulation.deliveries if not d.returned]
+        cycles = [b - a for a, b in zip(times, times[1:])]
+        lines.append("%-8s dashboard: %d items, cycle time mean %.0f ms  p95 %.0f ms"
+                     % (name, len(times), sum(cycles) / max(len(cycles), 1), bench.percentile(cycles, 95)))
+    cycles = max(len(served.deliveries), 1)
+    lines.append("polls:          %d, %.0f us wall time each, %.0f us per cycle on this computer"
+                 % (served.polls, served.poll_time * 1e6 / max(served.polls, 1), served.poll_time * 1e6 / cycles))
+    lines.append("event stream:   %d events received" % len(served.reader.events))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the dashboard of a simulated robot.")
+    parser.add_argument("scenario", nargs="?", default=sim.DEFAULT_SCENARIO)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--speed", type=float, default=1.0, help="times real time the robot runs at")
+    parser.add_argument("--items", type=int, default=None, help="number of blocks to sort")
+    parser.add_argument("--check", action="store_true", help="test the dashboard from a client instead")
+    args = parser.parse_args()
+
+    if not args.check:
+        print("Dashboard on http://localhost:%d/" % args.port)
+        print(bench.report(run(args.scenario, args.items, args.port, args.speed)))
+        return
+
+    results = []
+    client = threading.Thread(target=check, args=(args.port, results), daemon=True)
+    client.start()
+    run(args.scenario, args.items or 20, args.port, CHECK_SPEED)
+    client.join(TIMEOUT)
+    for step, passed, detail in results:
+        print("%-14s %s  %s" % (step + ":", "ok" if passed else "FAILED", detail))
+    for line in overhead(args.scenario, args.items or 30, args.port):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
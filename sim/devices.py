@@ -0,0 +1,399 @@
+'''Simulated EV3 brick, motors and sensors with the pybricks method names.'''
+
+import threading
+
+from sim.parameters import Button, Color, Direction, Stop
+from sim.profile import Profile
+
+current = None              # Simulation the devices attach to, set by sim.install()
+local = threading.local()   # local.simulation overrides current in one thread, see sim.cell
+
+DEFAULT_SPEED = 800         # deg/s of an ungeared EV3 motor
+DEFAULT_ACCELERATION = 1600
+DEFAULT_STALL_TIME = 200
+
+
+def _simulation():
+    simulation = getattr(local, "simulation", None)
+    if simulation is not None:
+        return simulation
+    if current is None:
+        raise RuntimeError("sim.install() has not been called")
+    return current
+
+
+def _gearRatio(gears):
+    if not gears:
+        return 1.0
+    if not isinstance(gears[0], (list, tuple)):
+        gears = [gears]
+    ratio = 1.0
+    for train in gears:
+        ratio *= float(train[-1]) / train[0]
+    return ratio
+
+
+class Control:
+    def __init__(self, motor):
+        self._motor = motor
+
+    def limits(self, speed=None, acceleration=None, actuation=None):
+        motor = self._motor
+        if speed is None and acceleration is None and actuation is None:
+            return (motor.max_speed, motor.max_acceleration, motor.actuation)
+        if speed is not None:
+            motor.max_speed = speed
+        if acceleration is not None:
+            motor.max_acceleration = acceleration
+        if actuation is not None:
+            motor.actuation = actuation
+
+    def stall_tolerances(self, speed=None, time=None):
+        motor = self._motor
+        if speed is None and time is None:
+            return (motor.stall_speed, motor.stall_time)
+        if speed is not None:
+            motor.stall_speed = speed
+        if time is not None:
+            motor.stall_time = time
+
+    def stalled(self):
+        return self._motor.isStalled()
+
+    def done(self):
+        return self._motor.isDone()
+
+
+class Motor:
+    '''Motor moving along trapezoidal profiles on the virtual clock.
+
+    The motor works in a physical frame fixed by the scenario; angle() and
+    reset_angle() only move the offset between that frame and the user's.
+    '''
+
+    def __init__(self, port, positive_direction=Direction.CLOCKWISE, gears=None):
+        self._sim = _simulation()
+        self.port = port
+        self.role = self._sim.role(port)
+        spec = self._sim.motorSpec(port)
+        ratio = _gearRatio(gears)
+
+        self.max_speed = spec.get("speed", DEFAULT_SPEED / ratio)
+        self.max_acceleration = spec.get("acceleration", DEFAULT_ACCELERATION / ratio)
+        self.actuation = 100
+        self.stall_speed = self.max_speed / 5
+        self.stall_time = DEFAULT_STALL_TIME
+        self.control = Control(self)
+
+        self._min = spec.get("min", -100000)
+        self._max = spec.get("max", 100000)
+        self._offset = 0.0
+        self._events = []
+        self._rest(spec.get("start", 0))
+        self._sim.attach(port, self)
+
+    # region Motion model
+
+    def _rest(self, position):
+        for event in self._events:
+            self._sim.clock.cancel(event)
+        self._events = []
+        self._t0 = self._sim.clock.now
+        self._p0 = position
+        self._dir = 1
+        self._profile = None
+        self._limit = None
+        self._back = 0.0            # Degrees it may go back before running into its end stop
+        self.hit_time = None
+
+    def physical(self):
+        if self._profile is None:
+            return self._p0
+        travel = self._profile.travel((self._sim.clock.now - self._t0) / 1000.0)
+        if self._limit is not None:
+            travel = min(travel, self._limit)
+        return self._p0 + self._dir * max(travel, -self._back)
+
+    def velocity(self):
+        '''Physical deg/s the motor turns at now, 0 once it ran into something.'''
+        if self._profile is None or self.hit_time is not None and self._sim.clock.now >= self.hit_time:
+            return 0.0
+        return self._dir * self._profile.velocity((self._sim.clock.now - self._t0) / 1000.0)
+
+    def timeAtPosition(self, position):
+        '''Clock time at which the current move passes ``position``, or None.'''
+        if self._profile is None:
+            return None
+        travel = (position - self._p0) * self._dir
+        if travel < 0 or (self._limit is not None and travel > self._limit):
+            return None
+        at = self._profile.timeAt(travel)
+        return None if at is None else self._t0 + at * 1000.0
+
+    def _command(self, target, direction, speed):
+        '''Starts a move towards physical ``target`` (None runs forever) from the current velocity.'''
+        position = self.physical()
+        velocity = self.velocity()
+        self._rest(position)
+        self._dir = direction
+
+        bound = self._max if direction > 0 else self._min
+        limit = max((bound - position) * direction, 0)
+        obstacle = self._sim.obstacle(self.role, position, direction)
+        if obstacle is not None:
+            limit = min(limit, max((obstacle - position) * direction, 0))
+        self._back = max((position - (self._min if direction > 0 else self._max)) * direction, 0)
+
+        distance = None if target is None else abs(target - position)
+        speed = min(abs(speed), self.max_speed)
+        self._profile = Profile(distance, speed, self.max_acceleration, velocity * direction)
+        if distance is not None and limit >= self._profile.reach:
+            limit = None
+        self._limit = limit
+        if limit is not None:
+            self.hit_time = self._t0 + self._profile.timeAt(limit) * 1000.0
+        self._events = self._sim.onCommand(self.role, self, direction)
+
+    def obstruct(self, position):
+        '''Ends the current move at physical ``position`` as if it ran into something there.'''
+        limit = max((position - self._p0) * self._dir, 0)
+        if self._profile is None or self._limit is not None and limit >= self._limit:
+            return
+        at = self._profile.timeAt(limit)
+        if at is not None:          # Does not get that far otherwise
+            self._limit = limit
+            self.hit_time = self._t0 + at * 1000.0
+
+    def _finishTime(self):
+        if self.hit_time is not None:
+            return self.hit_time + self.stall_time
+        if self._profile is None or self._profile.duration is None:
+            return None
+        return self._t0 + self._profile.duration * 1000.0
+
+    def _waitDone(self):
+        finish = self._finishTime()
+        if finish is not None:
+            self._sim.clock.advance(finish - self._sim.clock.now)
+
+    def settledAt(self):
+        '''Clock time the motor came to rest, None while it is still moving.'''
+        if self._profile is None:
+            return self._t0
+        if self.hit_time is not None:
+            end = self.hit_time
+        elif self._profile.duration is not None:
+            end = self._t0 + self._profile.duration * 1000.0
+        else:
+            return None
+        return end if self._sim.clock.now >= end else None
+
+    def isStalled(self):
+        return self.hit_time is not None and self._sim.clock.now >= self.hit_time + self.stall_time
+
+    def isDone(self):
+        if self._profile is None:
+            return True
+        finish = self._finishTime()
+        return finish is not None and self._sim.clock.now >= finish
+
+    # endregion
+
+    # region pybricks API
+
+    def angle(self):
+        self._sim.spend("motor")
+        return int(round(self.physical() - self._offset))
+
+    def speed(self):
+        self._sim.spend("motor")
+        return int(self.velocity())
+
+    def reset_angle(self, angle=None):
+        if angle is None:
+            angle = 0
+        self._offset = self.physical() - angle
+
+    def stop(self):
+        '''Coasts, slowing down at the acceleration limit. The next command starts
+        from the speed it still has, like pybricks' trajectories do.'''
+        velocity = self.velocity()
+        if velocity == 0:
+            self._rest(self.physical())
+            return
+        direction = 1 if velocity > 0 else -1
+        self._command(self.physical() + velocity * velocity / (2 * self.max_acceleration) * direction,
+                      direction, abs(velocity))
+
+    def brake(self):
+        self.hold()
+
+    def hold(self):
+        '''Holds the current angle, the controller brakes far harder than a profile.'''
+        self._rest(self.physical())
+
+    def run(self, speed):
+        self._command(None, 1 if speed >= 0 else -1, speed)
+
+    def dc(self, duty):
+        self.run(self.max_speed * duty / 100.0)
+
+    def run_time(self, speed, time, then=Stop.HOLD, wait=True):
+        self.run(speed)
+        stop_at = self._sim.clock.schedule(self._sim.clock.now + time, self.stop)
+        self._events.append(stop_at)
+        if wait:
+            self._sim.clock.advance(time)
+
+    def run_target(self, speed, target_angle, then=Stop.HOLD, wait=True):
+        target = target_angle + self._offset
+        direction = 1 if target >= self.physical() else -1
+        self._command(target, direction, speed)
+        if wait:
+            self._waitDone()
+
+    def run_angle(self, speed, rotation_angle, then=Stop.HOLD, wait=True):
+        self.run_target(speed, self.physical() - self._offset + rotation_angle, then, wait)
+
+    def run_until_stalled(self, speed, then=Stop.COAST, duty_limit=None):
+        self.run(speed)
+        self._waitDone()
+        self.stop()
+        return self.angle()
+
+    # endregion
+
+
+class TouchSensor:
+    def __init__(self, port):
+        self._sim = _simulation()
+        self.port = port
+
+    def pressed(self):
+        self._sim.spend("touch")
+        return self._sim.switchPressed()
+
+
+class ColorSensor:
+    '''Reports the signature of the held block while it is in the sensor window.
+    On the belt_far and belt_near ports it reports the reflection of the belt.'''
+
+    def __init__(self, port):
+        self._sim = _simulation()
+        self.port = port
+        self.role = self._sim.role(port)
+        self._mode = None
+
+    def _read(self, mode):
+        if mode != self._mode:
+            self._mode = mode
+            self._sim.spend("sensor_mode")
+        self._sim.spend("sensor")
+        return self._sim.signature(self._sim.sensorBlock())
+
+    def color(self):
+        reported = self._read("color")["color"]
+        if isinstance(reported, list):
+            reported = self._sim.random.choice(reported)
+        return None if reported is None else getattr(Color, reported)
+
+    def reflection(self):
+        if self.role in ("belt_far", "belt_near"):
+            self._sim.spend("sensor")
+            return self._sim.beltReflection(self.role)
+        return self._sim.noisy(self._read("reflection")["reflection"] * self._sim.swing())
+
+    def ambient(self):
+        self._read("ambient")
+        return 0
+
+    def rgb(self):
+        values = self._read("rgb")["rgb"]
+        swing = self._sim.swing()
+        return tuple(self._sim.noisy(value * swing) for value in values)
+
+
+class Screen:
+    width = 178
+    height = 128
+
+    def __init__(self, sim):
+        self._sim = sim
+
+    def clear(self):
+        self._sim.spend("clear")
+
+    def draw_text(self, x, y, text, text_color=Color.BLACK, background_color=None):
+        self._sim.spend("draw_text")
+
+    def print(self, *args, **kwargs):
+        self._sim.spend("draw_text")
+
+    def set_font(self, font):
+        pass
+
+    def draw_box(self, x1, y1, x2, y2, r=0, fill=False, color=Color.BLACK):
+        self._sim.spend("draw_text")
+
+    def draw_line(self, x1, y1, x2, y2, width=1, color=Color.BLACK):
+        self._sim.spend("draw_text")
+
+
+class Buttons:
+    def __init__(self, sim):
+        self._sim = sim
+
+    def pressed(self):
+        self._sim.spend("buttons")
+        return [getattr(Button, name) for name in self._sim.pressedButtons()]
+
+
+class Speaker:
+    def beep(self, frequency=500, duration=100):
+        pass
+
+
+class Light:
+    def on(self, color):
+        pass
+
+    def off(self):
+        pass
+
+
+class EV3Brick:
+    def __init__(self):
+        sim = _simulation()
+        self.screen = Screen(sim)
+        self.buttons = Buttons(sim)
+        self.speaker = Speaker()
+        self.light = Light()
+
+
+class StopWatch:
+    def __init__(self):
+        self._sim = _simulation()
+        self._start = self._sim.clock.now
+        self._paused = None
+
+    def time(self):
+        end = self._paused if self._paused is not None else self._sim.clock.now
+        return int(end - self._start)
+
+    def pause(self):
+        if self._paused is None:
+            self._paused = self._sim.clock.now
+
+    def resume(self):
+        if self._paused is not None:
+            self._start += self._sim.clock.now - self._paused
+            self._paused = None
+
+    def reset(self):
+        self._start = self._sim.clock.now
+        if self._paused is not None:
+            self._paused = self._start
+
+
+def wait(time):
+    _simulation().clock.advance(time)
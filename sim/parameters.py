@@ -0,0 +1,42 @@
+'''Stand-ins for the constants in ``pybricks.parameters``.'''
+
+
+class _Constant:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return type(self).__name__ + "." + self.name
+
+
+def _members(cls, names):
+    for name in names:
+        setattr(cls, name, cls(name))
+    return cls
+
+
+class Port(_Constant):
+    pass
+
+
+class Stop(_Constant):
+    pass
+
+
+class Direction(_Constant):
+    pass
+
+
+class Color(_Constant):
+    pass
+
+
+class Button(_Constant):
+    pass
+
+
+_members(Port, ("A", "B", "C", "D", "S1", "S2", "S3", "S4"))
+_members(Stop, ("COAST", "BRAKE", "HOLD"))
+_members(Direction, ("CLOCKWISE", "COUNTERCLOCKWISE"))
+_members(Color, ("BLACK", "BLUE", "GREEN", "YELLOW", "RED", "WHITE", "BROWN", "ORANGE", "PURPLE"))
+_members(Button, ("LEFT", "RIGHT", "UP", "DOWN", "CENTER", "LEFT_UP", "LEFT_DOWN", "RIGHT_UP", "RIGHT_DOWN", "BEACON"))
@@ -0,0 +1,116 @@
+'''Trapezoidal speed profile used by the simulated motors.'''
+
+import math
+
+
+class Profile:
+    '''Move of ``distance`` degrees (None = run forever) starting at ``start_speed``.
+
+    Positions are expressed as travel from the start point and speeds as
+    velocity along the move; the motor applies the direction. A motor that
+    is still turning the other way first brakes to a stop, one that is too
+    fast to stop in time overshoots and comes back, so re-targeting a moving
+    motor never skips the deceleration.
+
+    The move is a list of segments of constant acceleration, each
+    (start time, duration, start travel, start velocity, acceleration); the
+    last one of a move that runs forever has no duration.
+    '''
+
+    def __init__(self, distance, speed, acceleration, start_speed=0.0):
+        self.distance = distance
+        self.acceleration = max(float(acceleration), 1e-6)
+        self.speed = max(abs(float(speed)), 1e-6)
+        self.segments = []
+        self._t = 0.0
+        self._s = 0.0
+        self._v = float(start_speed)
+
+        a = self.acceleration
+        if self._v < 0:                             # Turning the other way, brake first
+            self._add(-self._v / a, a)
+        if distance is None:
+            if self._v != self.speed:
+                self._add(abs(self.speed - self._v) / a, a if self._v < self.speed else -a)
+            self._add(None, 0.0)
+        else:
+            if self._v * self._v / (2 * a) > distance - self._s:    # Too fast to stop in time
+                self._add(self._v / a, -a)
+            self._trapezoid(distance - self._s)
+
+        self.duration = None if distance is None else self._t
+        # Segments turn around only at their ends, so the extremes of the travel are at those
+        ends = [segment[2] for segment in self.segments] + [self._s]
+        self.reach = None if distance is None else max(ends)     # Farthest travel, can be past distance
+        self.back = min(ends)                                    # Least travel, below 0 when it first brakes
+
+    def _add(self, duration, acceleration):
+        self.segments.append((self._t, duration, self._s, self._v, acceleration))
+        if duration is None:
+            return
+        self._s += self._v * duration + 0.5 * acceleration * duration * duration
+        self._v += acceleration * duration
+        self._t += duration
+
+    def _trapezoid(self, remaining):
+        '''Covers remaining degrees (negative goes back) from the current velocity, ending at rest.'''
+        a = self.acceleration
+        sign = 1 if remaining >= 0 else -1
+        remaining = abs(remaining)
+        v0 = self._v * sign         # >= 0 here, the velocity always points toward the target or is 0
+        if v0 > self.speed:         # Slower speed limit than it is going at
+            peak = self.speed
+        else:
+            peak = min(self.speed, math.sqrt((2 * a * remaining + v0 * v0) / 2))
+        ramp = abs(peak * peak - v0 * v0) / (2 * a)
+        brake = peak * peak / (2 * a)
+        cruise = max(remaining - ramp - brake, 0.0)
+        if peak != v0:
+            self._add(abs(peak - v0) / a, sign * (a if peak > v0 else -a))
+        if cruise > 0:
+            self._add(cruise / peak, 0.0)
+        if peak > 0:
+            self._add(peak / a, -sign * a)
+        self._v = 0.0
+
+    def _segment(self, t):
+        for segment in reversed(self.segments):
+            if t >= segment[0]:
+                return segment
+        return self.segments[0]
+
+    def travel(self, t):
+        '''Distance covered t seconds after the start.'''
+        if t <= 0:
+            return 0.0
+        if self.duration is not None and t >= self.duration:
+            return self._s
+        start, duration, s0, v0, acceleration = self._segment(t)
+        d = t - start
+        return s0 + v0 * d + 0.5 * acceleration * d * d
+
+    def velocity(self, t):
+        if t < 0 or self.duration is not None and t >= self.duration:
+            return 0.0
+        start, duration, s0, v0, acceleration = self._segment(t)
+        return v0 + acceleration * (t - start)
+
+    def timeAt(self, s):
+        '''Seconds after the start at which ``s`` degrees have first been covered, None if never.'''
+        if s == 0:
+            return 0.0
+        for start, duration, s0, v0, acceleration in self.segments:
+            if duration is None:
+                if v0 > 0 and s >= s0:
+                    return start + (s - s0) / v0
+                return None
+            end = s0 + v0 * duration + 0.5 * acceleration * duration * duration
+            if min(s0, end) <= s <= max(s0, end):
+                if acceleration == 0:
+                    return start + (s - s0) / v0
+                root = math.sqrt(max(v0 * v0 + 2 * acceleration * (s - s0), 0.0))
+                d = (-v0 + root) / acceleration
+                if not 0 <= d <= duration + 1e-9:
+                    d = (-v0 - root) / acceleration
+                return start + min(max(d, 0.0), duration)
+        return None
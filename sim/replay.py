@@ -0,0 +1,167 @@
+'''Runs main.py against a log recorded on the brick and compares the motor commands.
+
+    python3 -m sim.replay record.bin [scenario.json] [--verbose]
+
+Each color sensor returns the readings logged for its port in the order
+they were recorded, and the buttons follow the logged button states on the robot's
+clock. Motors, blocks and the feeder come from the scenario. The replay
+records its own log and reports where its motor commands first differ
+from the recorded ones, e.g. after a classifier change; a command only
+one of them has is a change too. Commands the replay sends after the
+log ended are only counted.
+'''
+
+import argparse
+import os
+import tempfile
+
+import sim
+from sim import bench, devices
+
+TAIL = 10000        # ms the replay may run past the last record
+
+
+class ReplaySensor:
+    '''Simulated color sensor that returns the readings logged for its port instead of its own.'''
+
+    def __init__(self, sensor, readings, recorder):
+        self.sensor = sensor        # Only used to charge the time a reading takes
+        self.readings = readings    # (kind, sensor id) -> logged fields without the id, oldest first
+        self.recorder = recorder
+        self.id = recorder.SENSOR_PORTS.index(sensor.port)
+
+    def next(self, kind):
+        readings = self.readings.get((kind, self.id))
+        if not readings:
+            raise sim.SimulationEnd()
+        return readings.pop(0)
+
+    def rgb(self):
+        self.sensor.rgb()
+        return self.next(self.recorder.RGB)
+
+    def reflection(self):
+        self.sensor.reflection()
+        return self.next(self.recorder.REFLECTION)[0]
+
+    def color(self):
+        self.sensor.color()
+        index = self.next(self.recorder.COLOR)[0]
+        return None if index == self.recorder.NO_COLOR else self.recorder.COLORS[index]
+
+    def ambient(self):
+        return self.sensor.ambient()
+
+
+class ReplayButtons:
+    '''Simulated buttons pressed as logged, by the time since the brick started.'''
+
+    def __init__(self, buttons, states, recorder):
+        self.buttons = buttons
+        self.states = states        # (time, mask), oldest first
+        self.recorder = recorder
+        self.watch = devices.StopWatch()
+
+    def pressed(self):
+        self.buttons.pressed()
+        now = self.watch.time()
+        mask = 0
+        for time, state in self.states:
+            if time > now:
+                break
+            mask = state
+        return self.recorder.maskButtons(mask)
+
+
+def run(path, scenario=None, verbose=False):
+    '''Replays the log at path. Returns the simulation, with the records of
+    the log as simulation.recorded and of the replay as simulation.replayed.'''
+    if scenario is None or isinstance(scenario, str):
+        scenario = sim.loadScenario(scenario or sim.DEFAULT_SCENARIO)
+    sim.install(scenario)
+    import recorder
+    records = recorder.read(path)
+
+    scenario.setdefault("feed", {})["count"] = 1000000     # The log decides when the replay ends
+    if records:
+        scenario["duration"] = records[-1][1] + TAIL
+
+    def setup(main, simulation):
+        readings = {}
+        states = []
+        for kind, time, fields in records:
+            if kind in (recorder.RGB, recorder.REFLECTION, recorder.COLOR):
+                readings.setdefault((kind, fields[0]), []).append(fields[1:])
+            elif kind == recorder.BUTTONS:
+                states.append((time, fields[0]))
+
+        def replaySensor(port):
+            return ReplaySensor(devices.ColorSensor(port), readings, recorder)
+
+        def replayBrick():
+            brick = devices.EV3Brick()
+            brick.buttons = ReplayButtons(brick.buttons, states, recorder)
+            return brick
+        main.ColorSensor = replaySensor
+        main.EV3Brick = replayBrick
+
+    replay_file = os.path.join(tempfile.mkdtemp(), "replay.bin")
+    simulation = bench.run(scenario, verbose=verbose, record=replay_file, setup=setup)
+    simulation.recorded = records
+    simulation.replayed = recorder.read(replay_file)
+    return simulation
+
+
+def report(simulation):
+    import recorder
+    recorded = [(time, fields) for kind, time, fields in simulation.recorded if kind == recorder.MOTOR]
+    replayed = [(time, fields) for kind, time, fields in simulation.replayed if kind == recorder.MOTOR]
+    end = simulation.recorded[-1][1] if simulation.recorded else 0
+    past = [command for command in replayed[len(recorded):] if command[0] > end]    # The log can not say
+    replayed = replayed[:len(replayed) - len(past)]
+    readings = [kind for kind, time, fields in simulation.recorded if kind in (recorder.RGB, recorder.REFLECTION, recorder.COLOR)]
+    used = [kind for kind, time, fields in simulation.replayed if kind in (recorder.RGB, recorder.REFLECTION, recorder.COLOR)]
+
+    lines = [
+        "records:        " + str(len(simulation.recorded)),
+        "sensor reads:   %d of %d replayed" % (len(used), len(readings)),
+        "motor commands: %d recorded, %d replayed" % (len(recorded), len(replayed)),
+    ]
+    if past:
+        lines.append("past the log:   %d more replayed after it ended at %.1f s" % (len(past), end / 1000.0))
+    for index, (old, new) in enumerate(zip(recorded, replayed)):
+        if old[1] != new[1]:
+            lines.append("first change:   command %d, recorded %s at %.1f s, replayed %s at %.1f s"
+                         % (index, old[1], old[0] / 1000.0, new[1], new[0] / 1000.0))
+            break
+    else:
+        count = min(len(recorded), len(replayed))
+        if len(recorded) > count:
+            lines.append("first change:   command %d, recorded %s at %.1f s, not replayed"
+                         % (count, recorded[count][1], recorded[count][0] / 1000.0))
+        elif len(replayed) > count:
+            lines.append("first change:   command %d, not recorded, replayed %s at %.1f s"
+                         % (count, replayed[count][1], replayed[count][0] / 1000.0))
+        else:
+            lines.append("first change:   none")
+    if recorded and replayed:
+        count = min(len(recorded), len(replayed))
+        lines.append("time to command %d: recorded %.1f s, replayed %.1f s"
+                     % (count - 1, recorded[count - 1][0] / 1000.0, replayed[count - 1][0] / 1000.0))
+    lines.append("wall time:      %.2f s (%.0fx real time)"
+                 % (simulation.wall_time, simulation.clock.now / 1000.0 / max(simulation.wall_time, 1e-9)))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded log on simulated hardware.")
+    parser.add_argument("log")
+    parser.add_argument("scenario", nargs="?", default=sim.DEFAULT_SCENARIO)
+    parser.add_argument("--verbose", action="store_true", help="show the robot's print output")
+    args = parser.parse_args()
+
+    print(report(run(args.log, args.scenario, args.verbose)))
+
+
+if __name__ == "__main__":
+    main()
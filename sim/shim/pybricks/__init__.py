@@ -0,0 +1 @@
+'''Simulated stand-in for pybricks, see the ``sim`` package.'''
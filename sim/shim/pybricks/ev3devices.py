@@ -0,0 +1 @@
+from sim.devices import Motor, TouchSensor, ColorSensor
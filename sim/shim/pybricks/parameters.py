@@ -0,0 +1 @@
+from sim.parameters import Port, Stop, Direction, Color, Button
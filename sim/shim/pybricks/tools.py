@@ -0,0 +1 @@
+from sim.devices import StopWatch, wait
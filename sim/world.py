@@ -0,0 +1,356 @@
+'''Simulated work cell: zones, blocks, the feeder and the virtual clock.'''
+
+import json
+import math
+import os
+import random
+
+from sim.clock import VirtualClock
+
+DEFAULT_SCENARIO = os.path.join(os.path.dirname(__file__), "scenarios", "default.json")
+
+ZONE_TOLERANCE = 6          # Degrees of base/elbow error that still count as "at the zone"
+BELT_TAIL = 15000           # ms the run goes on after the last belt block reached the pickup zone
+RELEASE_GAP = 3             # Degrees the gripper has to open past a block to let go of it
+
+# Time in ms that each kind of hardware access costs on the brick
+DEFAULT_COSTS = {
+    "motor": 0.05,
+    "buttons": 0.2,
+    "touch": 0.2,
+    "sensor": 1.0,
+    "sensor_mode": 20.0,    # Switching the EV3 color sensor between color/reflection/rgb
+    "clear": 8.0,
+    "draw_text": 2.0,
+}
+
+DEFAULT_PORTS = {
+    "gripper": "A",
+    "elbow": "B",
+    "base": "C",
+    "switch": "S1",
+    "sensor": "S2",
+    "belt_far": "S3",
+    "belt_near": "S4",
+}
+
+
+def loadScenario(path=DEFAULT_SCENARIO):
+    with open(path) as f:
+        return json.load(f)
+
+
+class Block:
+    def __init__(self, ident, color, size, arrived):
+        self.ident = ident
+        self.color = color          # Color name, e.g. "RED"
+        self.size = size            # "BIG" or "SMALL"
+        self.arrived = arrived
+        self.gripped = None         # Time of the first grip
+        self.delivered = None
+
+    def __repr__(self):
+        return "Block(" + str(self.ident) + ", " + self.color + ", " + self.size + ")"
+
+
+class SimZone:
+    def __init__(self, spec):
+        self.angle = spec["angle"]
+        self.hight = spec.get("hight", 30)
+        self.color = spec.get("color")      # Expected color, used to count misrouted blocks
+        self.blocks = []
+
+
+class Delivery:
+    def __init__(self, time, block, zone_index, returned):
+        self.time = time
+        self.block = block
+        self.zone_index = zone_index
+        self.returned = returned            # True if put back on the feed zone
+
+
+class Simulation:
+    '''Everything the simulated devices need to answer queries.'''
+
+    def __init__(self, scenario, clock=None):
+        self.scenario = scenario
+        self.clock = clock or VirtualClock()
+        self.clock.limit = scenario.get("duration")
+        self.random = random.Random(scenario.get("seed", 1))
+
+        self.costs = dict(DEFAULT_COSTS)
+        self.costs.update(scenario.get("costs", {}))
+        self.ports = dict(DEFAULT_PORTS)
+        self.ports.update(scenario.get("ports", {}))
+
+        self.motors = {}
+        self.zones = [SimZone(spec) for spec in scenario["zones"]]
+        self.held = None
+        self.deliveries = []
+        self.dropped = 0
+        self.stats = {}
+
+        feed = scenario.get("feed", {})
+        self.feed_zones = feed.get("zones", [feed.get("zone", 0)])
+        self.feed_count = feed.get("count", 100)
+        self.feed_interval = feed.get("interval", 0)
+        self.feed_items = feed.get("items")
+        self.feed_mix = feed.get("mix", [["RED", "BIG", 1]])
+        self.produced = 0
+        self.sorted = 0
+        for zone in self.feed_zones:
+            self.clock.schedule(feed.get("first", 0), lambda zone=zone: self.feed(zone))
+
+        self.belt = scenario.get("belt")
+        self.belt_items = []        # [block, time its center is under the jaws], oldest first
+        self.belt_attempts = 0
+        self.belt_grips = 0
+        self.belt_passed = 0
+        if self.belt is not None:
+            self.clock.schedule(feed.get("first", 0), self.beltFeed)
+
+        self.buttons = scenario.get("buttons", [])
+        self.sensor = scenario.get("sensor", {})
+        self.switch_angle = scenario.get("switch", -15)
+
+    # region Bookkeeping
+
+    def spend(self, kind):
+        '''Charges the hardware access cost of ``kind`` to the clock.'''
+        self.stats[kind] = self.stats.get(kind, 0) + 1
+        cost = self.costs.get(kind, 0)
+        if cost:
+            self.clock.advance(cost)
+
+    def role(self, port):
+        for name, value in self.ports.items():
+            if value == port.name:
+                return name
+        return None
+
+    def motorSpec(self, port):
+        return self.scenario.get("motors", {}).get(self.role(port), {})
+
+    def attach(self, port, motor):
+        self.motors[self.role(port)] = motor
+
+    def angleOf(self, role):
+        motor = self.motors.get(role)
+        return motor.physical() if motor is not None else 0
+
+    # endregion
+
+    # region Blocks
+
+    def feed(self, zone):
+        if self.produced >= self.feed_count:
+            return
+        self.zones[zone].blocks.append(self.newBlock(self.clock.now))
+
+    def newBlock(self, arrived):
+        if self.feed_items:
+            color, size = self.feed_items[self.produced % len(self.feed_items)]
+        else:
+            total = sum(item[2] for item in self.feed_mix)
+            pick = self.random.uniform(0, total)
+            for color, size, weight in self.feed_mix:
+                pick -= weight
+                if pick <= 0:
+                    break
+        self.produced += 1
+        return Block(self.produced, color, size, arrived)
+
+    def zoneAt(self, angle):
+        for index, zone in enumerate(self.zones):
+            if abs(zone.angle - angle) <= ZONE_TOLERANCE:
+                return index
+        return None
+
+    def blockInJaws(self):
+        index = self.zoneAt(self.angleOf("base"))
+        if index is None:
+            return None
+        zone = self.zones[index]
+        if zone.blocks and abs(self.angleOf("elbow") - zone.hight) <= ZONE_TOLERANCE:
+            return zone.blocks[-1]
+        return None
+
+    def blockWidth(self, block):
+        return self.scenario.get("widths", {}).get(block.size, 20)
+
+    def grip(self, block):
+        index = self.zoneAt(self.angleOf("base"))
+        if self.held is not None or index is None or block not in self.zones[index].blocks:
+            return
+        self.zones[index].blocks.remove(block)
+        self.held = block
+        if block.gripped is None:
+            block.gripped = self.clock.now
+        if index in self.feed_zones and not self.zones[index].blocks:
+            self.clock.schedule(self.clock.now + self.feed_interval, lambda: self.feed(index))
+
+    def release(self):
+        block = self.held
+        if block is None:
+            return
+        self.held = None
+        index = self.zoneAt(self.angleOf("base"))
+        if index is None:
+            self.dropped += 1
+            return
+
+        if self.belt is not None and index == self.belt["zone"]:
+            self.deliveries.append(Delivery(self.clock.now, block, index, True))    # Carried off by the belt
+            self.belt_passed += 1
+            return
+        self.zones[index].blocks.append(block)
+        returned = index in self.feed_zones
+        self.deliveries.append(Delivery(self.clock.now, block, index, returned))
+        if not returned:
+            block.delivered = self.clock.now
+            self.sorted += 1
+            if self.sorted >= self.feed_count:
+                self.clock.finished = True
+
+    # endregion
+
+    # region Belt
+
+    def beltFeed(self):
+        '''Puts a block on the belt upstream of the sensors, every interval ms.'''
+        if self.produced >= self.feed_count:
+            return
+        speed = self.belt["speed"] / 1000.0         # mm/ms
+        at = self.clock.now + (max(self.belt["sensors"]) + self.belt.get("lead", 50)) / speed
+        block = self.newBlock(at)
+        self.belt_items.append([block, at])
+        self.clock.schedule(at + self.belt["capture"] / speed + 1, lambda: self.beltPassed(block))
+        if self.produced < self.feed_count:
+            self.clock.schedule(self.clock.now + self.belt["interval"], self.beltFeed)
+        else:
+            self.clock.schedule(at + BELT_TAIL, self.finish)
+
+    def finish(self):
+        self.clock.finished = True
+
+    def beltPosition(self, item, time):
+        '''mm of the block's center past the jaws, negative while upstream.'''
+        return (time - item[1]) * self.belt["speed"] / 1000.0
+
+    def beltLength(self, block):
+        return self.belt.get("lengths", {}).get(block.size, self.blockWidth(block))
+
+    def beltPassed(self, block):
+        for item in self.belt_items:
+            if item[0] is block:
+                self.belt_items.remove(item)
+                self.belt_passed += 1
+                return
+
+    def beltReflection(self, role):
+        distance = self.belt["sensors"][0 if role == "belt_far" else 1]
+        for item in self.belt_items:
+            if abs(self.beltPosition(item, self.clock.now) + distance) <= self.beltLength(item[0]) / 2.0:
+                return self.noisy(self.belt.get("block_reflection", 40))
+        return self.noisy(self.belt.get("belt_reflection", 5))
+
+    def beltGrip(self, motor):
+        '''Closing jaws at the belt zone catch the block whose center is within capture mm of them.'''
+        zone = self.zones[self.belt["zone"]]
+        if abs(self.angleOf("elbow") - zone.hight) > ZONE_TOLERANCE:
+            return []
+        self.belt_attempts += 1
+        for item in self.belt_items:
+            width = self.blockWidth(item[0])
+            at = motor.timeAtPosition(-width)
+            if at is not None and abs(self.beltPosition(item, at)) <= self.belt["capture"]:
+                motor.obstruct(-width)
+                return [self.clock.schedule(motor.hit_time, lambda item=item: self.beltGrab(item))]
+        return []
+
+    def beltGrab(self, item):
+        if item not in self.belt_items or self.held is not None:
+            return
+        self.belt_items.remove(item)
+        self.held = item[0]
+        self.held.gripped = self.clock.now
+        self.belt_grips += 1
+
+    # endregion
+
+    # region Device hooks
+
+    def obstacle(self, role, position, direction):
+        '''Physical angle at which a move of ``role`` gets blocked, or None.'''
+        if role != "gripper" or direction <= 0:
+            return None
+        if self.held is not None:
+            return -self.blockWidth(self.held)
+        block = self.blockInJaws()
+        if block is not None and position < -self.blockWidth(block):
+            return -self.blockWidth(block)
+        return None
+
+    def onCommand(self, role, motor, direction):
+        '''Queues the grip/release a freshly commanded gripper move will cause.'''
+        if role != "gripper":
+            return []
+        if (direction > 0 and self.held is None and self.belt is not None and
+                self.zoneAt(self.angleOf("base")) == self.belt["zone"]):
+            return self.beltGrip(motor)
+        if direction > 0 and self.held is None and motor.hit_time is not None:
+            block = self.blockInJaws()
+            if block is not None:
+                return [self.clock.schedule(motor.hit_time, lambda: self.grip(block))]
+        if direction < 0 and self.held is not None:
+            at = motor.timeAtPosition(-self.blockWidth(self.held) - RELEASE_GAP)
+            if at is not None:
+                return [self.clock.schedule(at, self.release)]
+        return []
+
+    def pressedButtons(self):
+        now = self.clock.now
+        pressed = []
+        for entry in self.buttons:
+            if entry["at"] <= now < entry["at"] + entry.get("hold", 100):
+                pressed.extend(entry["press"])
+        return pressed
+
+    def switchPressed(self):
+        return self.angleOf("base") <= self.switch_angle
+
+    def sensorBlock(self):
+        '''Block in front of the color sensor, if the elbow is in its window.'''
+        if self.held is None:
+            return None
+        center = self.sensor.get("center", 63)
+        window = self.sensor.get("window", 4)
+        if abs(self.angleOf("elbow") - center) <= window:
+            return self.held
+        return None
+
+    def signature(self, block):
+        if block is None:
+            return self.sensor.get("empty", {"color": None, "reflection": 1, "rgb": [1, 1, 1]})
+        return self.sensor["signatures"][block.color][block.size]
+
+    def swing(self):
+        '''Factor the held block's readings drop by while it swings after the elbow stops.'''
+        swing = self.sensor.get("swing")
+        motor = self.motors.get("elbow")
+        if not swing or motor is None:
+            return 1.0
+        stopped = motor.settledAt()
+        if stopped is None:
+            return 1.0
+        since = self.clock.now - stopped
+        phase = 0.5 + 0.5 * math.cos(2 * math.pi * since / swing.get("period", 100))
+        return 1.0 - swing.get("amplitude", 0) * math.exp(-since / swing.get("decay", 100)) * phase
+
+    def noisy(self, value):
+        sigma = self.sensor.get("noise", 0)
+        if sigma:
+            value += self.random.gauss(0, sigma)
+        return int(min(100, max(0, round(value))))
+
+    # endregion
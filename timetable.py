@@ -0,0 +1,74 @@
+'''Sort windows: the times the robot sorts, on the scheduler's StopWatch clock.
+
+Window times are absolute ms on that clock and the k-th start of a
+recurring window is computed as start + k * every, so the schedule does not
+drift however long the robot runs.
+'''
+
+
+class SortWindow:
+
+    def __init__(self, start, length=None, every=None):
+        self.start = start
+        self.length = length        # ms, None sorts until stopped
+        self.every = every          # ms between starts, None runs once
+
+    def latestStart(self, now):
+        '''Start of the last occurrence at or before now, None if the first is still ahead.'''
+        if now < self.start:
+            return None
+        if not self.every:
+            return self.start
+        return self.start + (now - self.start) // self.every * self.every
+
+    def active(self, now):
+        start = self.latestStart(now)
+        return start is not None and (self.length is None or now < start + self.length)
+
+    def over(self, now):
+        '''True once a window that runs once has ended.'''
+        return not self.every and self.length is not None and now >= self.start + self.length
+
+    def nextStart(self, now):
+        '''First start after now, None if the window does not come again.'''
+        if now < self.start:
+            return self.start
+        if not self.every:
+            return None
+        return self.latestStart(now) + self.every
+
+
+class SortSchedule:
+
+    def __init__(self):
+        self.windows = []
+
+    def __len__(self):
+        return len(self.windows)
+
+    def add(self, start, length=None, every=None):
+        window = SortWindow(start, length, every)
+        self.windows.append(window)
+        return window
+
+    def clear(self):
+        self.windows = []
+
+    def prune(self, now):
+        '''Drops the windows that are over. Once every window is, the robot sorts as without windows.'''
+        self.windows = [window for window in self.windows if not window.over(now)]
+
+    def active(self, now):
+        '''True inside any window, and always while there are no windows.'''
+        if not self.windows:
+            return True
+        for window in self.windows:
+            if window.active(now):
+                return True
+        return False
+
+    def nextStart(self, now):
+        '''Time the next window starts, None if none will.'''
+        starts = [window.nextStart(now) for window in self.windows]
+        starts = [start for start in starts if start is not None]
+        return min(starts) if starts else None
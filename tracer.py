@@ -0,0 +1,86 @@
+'''Timing of the sort cycle's phases in a preallocated ring buffer.
+
+Code around a phase calls begin() and end(). While tracing is off begin()
+returns None and end() returns straight away, so the calls cost next to
+nothing. Once SIZE phases are stored the oldest get overwritten.
+'''
+
+from array import array
+
+# Phase ids, stored as one byte each
+CYCLE = 0       # Grip to drop off, the US16 pick up to drop off time
+OPEN = 1
+LIFT = 2        # Elbow up to the clearance the base may turn at
+ROTATE = 3
+DESCEND = 4     # Elbow down once the base has arrived
+GRIP = 5
+SENSOR = 6
+DROP = 7
+RETURN = 8      # Empty move to the next pickup zone
+WAIT = 9
+PHASES = ["cycle", "open", "lift", "rotate", "descend", "grip", "sensor", "drop", "return", "wait"]
+
+NO_ZONE = 255
+SIZE = 256
+
+
+class Tracer:
+
+    def __init__(self, clock, size=SIZE):
+        self.clock = clock          # Returns the time in ms
+        self.enabled = False
+        self.size = size
+        self.phases = bytearray(size)
+        self.zones = bytearray(size)
+        self.starts = array("l", [0] * size)
+        self.durations = array("l", [0] * size)
+        self.next = 0               # Slot the next phase is stored in
+        self.count = 0
+
+    def begin(self):
+        '''Start time to pass to end(), None while tracing is off.'''
+        return self.clock() if self.enabled else None
+
+    def end(self, phase, start, zone=None):
+        if start is None:
+            return
+        index = self.next
+        self.phases[index] = phase
+        self.zones[index] = NO_ZONE if zone is None else zone
+        self.starts[index] = start
+        self.durations[index] = self.clock() - start
+        self.next = (index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def clear(self):
+        self.next = 0
+        self.count = 0
+
+    def entries(self):
+        '''(phase, zone, start, duration) of the stored phases, oldest first.'''
+        first = (self.next - self.count) % self.size
+        for offset in range(self.count):
+            index = (first + offset) % self.size
+            zone = self.zones[index]
+            yield (self.phases[index], None if zone == NO_ZONE else zone,
+                   self.starts[index], self.durations[index])
+
+    def summary(self):
+        '''(phase, zone) -> [count, total ms, longest ms].'''
+        totals = {}
+        for phase, zone, start, duration in self.entries():
+            entry = totals.get((phase, zone))
+            if entry is None:
+                totals[(phase, zone)] = [1, duration, duration]
+            else:
+                entry[0] += 1
+                entry[1] += duration
+                entry[2] = max(entry[2], duration)
+        return totals
+
+    def dump(self, path):
+        '''Writes one "phase zone start duration" line per stored phase.'''
+        with open(path, "w") as f:
+            for phase, zone, start, duration in self.entries():
+                f.write(PHASES[phase] + " " + ("-" if zone is None else str(zone)) + " " +
+                        str(start) + " " + str(duration) + "\n")
@@ -0,0 +1,40 @@
+'''Speed and acceleration limits of arm moves, and the clearance of every move between two zones.
+
+Moves carrying a block use the gentler LOADED limits. The clearance table
+is built from the zone angles and hights at startup and again after the
+menu changes a zone, so moves between zones only look it up.
+'''
+
+
+class Limits:
+    def __init__(self, base_speed, base_acceleration, elbow_speed, elbow_acceleration):
+        self.base_speed = base_speed                    # deg/s
+        self.base_acceleration = base_acceleration      # deg/s^2
+        self.elbow_speed = elbow_speed
+        self.elbow_acceleration = elbow_acceleration
+
+
+EMPTY = Limits(240, 480, 100, 240)
+LOADED = Limits(150, 200, 60, 120)
+
+
+def limits(loaded):
+    return LOADED if loaded else EMPTY
+
+
+class ClearanceTable:
+
+    def __init__(self):
+        self.table = {}
+
+    def build(self, zones, clearance):
+        '''Computes the entry of every (from, to) pair of zone indexes. clearance(start, end)
+        gives the elbow angle needed to pass over the zones between two base angles.'''
+        self.table = {}
+        for i, start in enumerate(zones):
+            for j, end in enumerate(zones):
+                self.table[(i, j)] = clearance(start.angle, end.angle)
+
+    def lookup(self, start, end):
+        '''Elbow angle the base may turn at between zone indexes, None if either is None.'''
+        return self.table.get((start, end))
@@ -0,0 +1,106 @@
+'''Collection of zones with lookups by color and by base angle.
+
+The lookups are rebuilt by reindex(), which is only needed after a zone
+has been edited, so sorting a block or finding the nearest zone does not
+depend on how many zones there are.
+'''
+
+
+class ZoneMap:
+
+    def __init__(self, zones=None):
+        self.zones = list(zones) if zones else []
+        self.reindex()
+
+    def __len__(self):
+        return len(self.zones)
+
+    def __getitem__(self, index):
+        return self.zones[index]
+
+    def __iter__(self):
+        return iter(self.zones)
+
+    def __contains__(self, zone):
+        return zone in self.zones
+
+    def index(self, zone):
+        return self.zones.index(zone)
+
+    def append(self, zone):
+        self.zones.append(zone)
+
+    def reindex(self, pickups=()):
+        '''Rebuilds the color index (leaving out the pickup zones) and the angle order.'''
+        self.by_color = {}
+        for index, zone in enumerate(self.zones):
+            if index not in pickups and zone.color not in self.by_color:
+                self.by_color[zone.color] = index
+
+        order = sorted(range(len(self.zones)), key=lambda index: self.zones[index].angle)
+        self.order = order
+        self.angles = [self.zones[index].angle for index in order]
+
+    def forColor(self, color):
+        '''Index of the drop off zone for color, None if no zone has it.'''
+        return self.by_color.get(color)
+
+    def _bisect(self, angle):
+        '''Position of the first sorted angle >= angle.'''
+        low, high = 0, len(self.angles)
+        while low < high:
+            middle = (low + high) // 2
+            if self.angles[middle] < angle:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def nearest(self, angle):
+        '''Index of the zone closest to a base angle, None if there are no zones.'''
+        if not self.angles:
+            return None
+        position = self._bisect(angle)
+        if position == len(self.angles):
+            position -= 1
+        elif position > 0 and angle - self.angles[position - 1] < self.angles[position] - angle:
+            position -= 1
+        return self.order[position]
+
+    def between(self, low, high):
+        '''Indexes of the zones with low <= angle <= high.'''
+        found = []
+        position = self._bisect(low)
+        while position < len(self.angles) and self.angles[position] <= high:
+            found.append(self.order[position])
+            position += 1
+        return found
+
+
+class PickupPlanner:
+    '''Chooses which pickup zone to check next.
+
+    Each round goes to the closest pickup zone that has not been found
+    empty yet, so after a drop off the arm serves the feeder nearest to
+    that drop zone. The round ends when every pickup zone was empty.
+    '''
+
+    def __init__(self):
+        self.empty = set()
+
+    def reset(self):
+        '''Starts a new round, every pickup zone gets checked again.'''
+        self.empty = set()
+
+    def markEmpty(self, index):
+        self.empty.add(index)
+
+    def next(self, zones, pickups, angle):
+        '''Index of the pickup zone to check from base angle, None once all were empty.'''
+        best = None
+        for index in pickups:
+            if index in self.empty:
+                continue
+            if best is None or abs(zones[index].angle - angle) < abs(zones[best].angle - angle):
+                best = index
+        return best